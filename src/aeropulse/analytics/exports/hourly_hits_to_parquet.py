@@ -5,8 +5,9 @@ from pathlib import Path
 
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine.url import make_url
+from sqlalchemy import text
+
+from aeropulse.etl.load.loader.pg_loader import get_engine
 
 load_dotenv()
 
@@ -14,20 +15,15 @@ DEF_WINDOW_MIN = int(os.getenv("HITS_EXPORT_WINDOW_MIN", "60"))
 OUT_DIR = Path(os.getenv("PROCESSED_DIR", "data/processed")) / "flight_weather_hits"
 
 
-def _engine():
-    dsn = os.getenv("POSTGRES_DSN") or os.getenv("DATABASE_URL")
-    if not dsn:
-        raise RuntimeError("Set POSTGRES_DSN or DATABASE_URL")
-    return create_engine(dsn, future=True)
-
-
 def main():
-    eng = _engine()
+    eng = get_engine()
     cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=DEF_WINDOW_MIN)
 
     sql = text(
         """
-        SELECT icao24, callsign, t, h3_res6, weather_ts, weather
+        SELECT icao24, callsign, t, h3_res6, weather_ts,
+               wx_main, wx_temp, wx_wind_speed, wx_wind_gust,
+               wx_visibility, wx_clouds, wx_pressure
         FROM public.flight_weather_hits
         WHERE t >= :cutoff
         ORDER BY t
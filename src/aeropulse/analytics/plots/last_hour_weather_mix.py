@@ -2,12 +2,12 @@
 import os
 import datetime as dt
 from pathlib import Path
-from typing import Any, Dict, List
-
 import matplotlib.pyplot as plt
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from aeropulse.etl.load.loader.pg_loader import get_engine
 
 load_dotenv()
 
@@ -15,38 +15,14 @@ WINDOW_MIN = int(os.getenv("HITS_PLOT_WINDOW_MIN", "60"))
 PLOTS_DIR = Path(os.getenv("PROCESSED_DIR", "data/processed")) / "plots"
 
 
-def _engine():
-    dsn = os.getenv("POSTGRES_DSN") or os.getenv("DATABASE_URL")
-    if not dsn:
-        raise RuntimeError("Set POSTGRES_DSN or DATABASE_URL")
-    return create_engine(dsn, future=True)
-
-
-def _weather_main(w: Dict[str, Any]) -> str:
-    """
-    Extract a 'main' label for quick grouping.
-    We try OpenWeather-like formats:
-      - if payload has 'weather' array with dicts: take weather[0]['main']
-      - else fallback to 'Unknown'
-    """
-    if not isinstance(w, dict):
-        return "Unknown"
-    arr = w.get("weather")
-    if isinstance(arr, list) and arr:
-        first = arr[0] or {}
-        label = first.get("main")
-        if isinstance(label, str) and label:
-            return label
-    return "Unknown"
-
-
 def main():
-    eng = _engine()
+    eng = get_engine()
     cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=WINDOW_MIN)
 
     sql = text(
         """
-        SELECT icao24, callsign, t, h3_res6, weather
+        SELECT icao24, callsign, t, h3_res6,
+               COALESCE(wx_main, 'Unknown') AS weather_main
         FROM public.flight_weather_hits
         WHERE t >= :cutoff
         """
@@ -58,9 +34,6 @@ def main():
         print(f"[plots] No hits in last {WINDOW_MIN} minutes.")
         return
 
-    # Extract a simple label for weather
-    df["weather_main"] = df["weather"].apply(_weather_main)
-
     # 1) pie: mix of weather_main
     counts = df["weather_main"].value_counts().sort_values(ascending=False)
 
@@ -1,10 +1,14 @@
 # src/aeropulse/etl/bootstrap_db.py
 
+import argparse
 import logging
+import textwrap
 from pathlib import Path
 from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
 
 from aeropulse.etl.load.loader.pg_loader import get_engine, masked_dsn_for_log
+from aeropulse.models.weather_res6 import WEATHER_COLUMNS
 from aeropulse.utils.logging_config import setup_logger
 
 Path("logs").mkdir(parents=True, exist_ok=True)
@@ -12,6 +16,20 @@ Path("logs").mkdir(parents=True, exist_ok=True)
 
 logger = setup_logger("bootstrap.log")
 
+
+def _weather_columns_ddl(table: str) -> str:
+    """ALTER adding the generated wx_* columns (see models.weather_res6) to `table`."""
+    dialect = postgresql.dialect()
+    adds = ",\n    ".join(
+        f"ADD COLUMN IF NOT EXISTS {name} {typ().compile(dialect=dialect)} "
+        f"GENERATED ALWAYS AS ({expr}) STORED"
+        for name, (typ, expr) in WEATHER_COLUMNS.items()
+    )
+    return f"ALTER TABLE public.{table}\n    {adds};"
+
+
+WEATHER_TABLES = ("weather_res6", "weather_res6_history", "flight_weather_hits")
+
 DDL_STATEMENTS = [
     "CREATE SCHEMA IF NOT EXISTS public;",
     """
@@ -25,6 +43,7 @@ DDL_STATEMENTS = [
     );
     """,
     "ALTER TABLE public.cities_us ADD COLUMN IF NOT EXISTS h3_res6 TEXT;",
+    "ALTER TABLE public.cities_us ADD COLUMN IF NOT EXISTS content_hash TEXT;",
     "CREATE INDEX IF NOT EXISTS idx_cities_us_h3_res6 ON public.cities_us(h3_res6);",
     """
     CREATE TABLE IF NOT EXISTS public.weather_res6 (
@@ -48,20 +67,160 @@ DDL_STATEMENTS = [
     "CREATE INDEX IF NOT EXISTS idx_weather_res6_history_h3_ts ON public.weather_res6_history (h3_res6, ts DESC);",
     """
     CREATE TABLE IF NOT EXISTS public.flight_weather_hits (
-        id              BIGSERIAL PRIMARY KEY,
-        icao24          TEXT NOT NULL,
-        call_sign       TEXT,
-        ts              TIMESTAMPTZ NOT NULL,
-        lat             DOUBLE PRECISION,
-        lon             DOUBLE PRECISION,
-        h3_res6         TEXT,
-        weather_kind    TEXT,
-        weather_temp_k  DOUBLE PRECISION,
-        raw_weather     JSONB
+        id               BIGSERIAL PRIMARY KEY,
+        icao24           TEXT NOT NULL,
+        callsign         TEXT,
+        t                TIMESTAMPTZ NOT NULL,
+        lat              DOUBLE PRECISION,
+        lon              DOUBLE PRECISION,
+        h3_res6          TEXT,
+        weather_h3_res6  TEXT,
+        weather_ts       TIMESTAMPTZ,
+        weather          JSONB
+    );
+    """,
+    # older databases: align legacy column names with the hits writers
+    """
+    DO $$
+    DECLARE
+        r RECORD;
+    BEGIN
+        FOR r IN
+            SELECT * FROM (VALUES ('call_sign', 'callsign'), ('ts', 't'), ('raw_weather', 'weather')) AS v(old, new)
+        LOOP
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'flight_weather_hits'
+                  AND column_name = r.old
+            ) AND NOT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'flight_weather_hits'
+                  AND column_name = r.new
+            ) THEN
+                EXECUTE format('ALTER TABLE public.flight_weather_hits RENAME COLUMN %I TO %I', r.old, r.new);
+            END IF;
+        END LOOP;
+    END $$;
+    """,
+    """
+    ALTER TABLE public.flight_weather_hits
+        DROP COLUMN IF EXISTS weather_kind,
+        DROP COLUMN IF EXISTS weather_temp_k,
+        DROP COLUMN IF EXISTS raw_weather,
+        ADD COLUMN IF NOT EXISTS weather_h3_res6 TEXT,
+        ADD COLUMN IF NOT EXISTS weather_ts TIMESTAMPTZ,
+        ADD COLUMN IF NOT EXISTS weather JSONB;
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_fwh_icao24_ts ON public.flight_weather_hits (icao24, t);",
+    "CREATE INDEX IF NOT EXISTS idx_fwh_h3_ts    ON public.flight_weather_hits (h3_res6, t);",
+    # one hit per aircraft, time and cell: reruns of either writer are no-ops
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_indexes
+            WHERE schemaname = 'public' AND indexname = 'uq_fwh_icao24_t_h3'
+        ) THEN
+            DELETE FROM public.flight_weather_hits a
+            USING public.flight_weather_hits b
+            WHERE a.icao24 = b.icao24 AND a.t = b.t AND a.h3_res6 = b.h3_res6
+              AND a.ctid < b.ctid;
+            CREATE UNIQUE INDEX uq_fwh_icao24_t_h3
+                ON public.flight_weather_hits (icao24, t, h3_res6);
+        END IF;
+    END $$;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.opensky_states (
+        id             BIGSERIAL PRIMARY KEY,
+        ts             TIMESTAMPTZ NOT NULL,
+        icao24         TEXT NOT NULL,
+        callsign       TEXT,
+        lat            DOUBLE PRECISION,
+        lon            DOUBLE PRECISION,
+        h3_res6        TEXT,
+        on_ground      BOOLEAN,
+        velocity       DOUBLE PRECISION,
+        heading        DOUBLE PRECISION,
+        vert_rate      DOUBLE PRECISION,
+        geo_altitude   DOUBLE PRECISION,
+        baro_altitude  DOUBLE PRECISION
+    );
+    """,
+    # replays must be idempotent: drop pre-existing duplicates once, then enforce (icao24, ts)
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_indexes
+            WHERE schemaname = 'public' AND indexname = 'uq_opensky_states_icao24_ts'
+        ) THEN
+            DELETE FROM public.opensky_states a
+            USING public.opensky_states b
+            WHERE a.icao24 = b.icao24 AND a.ts = b.ts AND a.ctid < b.ctid;
+            CREATE UNIQUE INDEX uq_opensky_states_icao24_ts
+                ON public.opensky_states (icao24, ts);
+        END IF;
+    END $$;
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_opensky_states_ts ON public.opensky_states (ts);",
+    """
+    CREATE TABLE IF NOT EXISTS public.etl_checkpoints (
+        stage       TEXT PRIMARY KEY,
+        last_id     TEXT,
+        last_ts     TIMESTAMPTZ,
+        updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
     );
     """,
-    "CREATE INDEX IF NOT EXISTS idx_fwh_icao24_ts ON public.flight_weather_hits (icao24, ts);",
-    "CREATE INDEX IF NOT EXISTS idx_fwh_h3_ts    ON public.flight_weather_hits (h3_res6, ts);",
+    """
+    CREATE TABLE IF NOT EXISTS public.api_rate_limits (
+        name         TEXT PRIMARY KEY,
+        tokens       DOUBLE PRECISION NOT NULL,
+        refilled_at  TIMESTAMPTZ NOT NULL,
+        day          DATE NOT NULL,
+        day_used     INTEGER NOT NULL DEFAULT 0
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.weather_cache (
+        h3_res6     TEXT NOT NULL,
+        units       TEXT NOT NULL,
+        lat         DOUBLE PRECISION,
+        lon         DOUBLE PRECISION,
+        fetched_at  TIMESTAMPTZ NOT NULL,
+        payload     JSONB NOT NULL,
+        PRIMARY KEY (h3_res6, units)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.weather_cache_claims (
+        h3_res6        TEXT NOT NULL,
+        units          TEXT NOT NULL,
+        claimed_until  TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (h3_res6, units)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.weather_refresh_queue (
+        h3_res6      TEXT PRIMARY KEY,
+        priority     DOUBLE PRECISION NOT NULL,
+        reason       TEXT NOT NULL,
+        enqueued_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_weather_refresh_queue_priority ON public.weather_refresh_queue (priority DESC);",
+    """
+    CREATE TABLE IF NOT EXISTS public.weather_cell_map (
+        h3_res6         TEXT PRIMARY KEY,
+        source_h3_res6  TEXT NOT NULL,
+        coverage_res    SMALLINT NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_weather_cell_map_source ON public.weather_cell_map (source_h3_res6);",
+    *(_weather_columns_ddl(table) for table in WEATHER_TABLES),
+    "CREATE INDEX IF NOT EXISTS idx_weather_res6_wx_main ON public.weather_res6 (wx_main);",
+    "CREATE INDEX IF NOT EXISTS idx_weather_res6_history_wx_main_ts ON public.weather_res6_history (wx_main, ts);",
+    "CREATE INDEX IF NOT EXISTS idx_fwh_wx_main ON public.flight_weather_hits (wx_main);",
 ]
 
 
@@ -79,5 +238,29 @@ def bootstrap_db():
     logger.info("DB bootstrap complete.")
 
 
+SCHEMA_SQL = Path(__file__).with_name("bootstrap_schema.sql")
+
+
+def write_schema_sql(path: Path = SCHEMA_SQL) -> None:
+    """Render DDL_STATEMENTS as a plain SQL script (bootstrap_schema.sql)."""
+    header = (
+        "-- src/aeropulse/etl/bootstrap_schema.sql\n"
+        "-- Generated from DDL_STATEMENTS in bootstrap_db.py; do not edit.\n"
+        "-- Regenerate with: python -m aeropulse.etl.bootstrap_db --sql\n"
+    )
+    body = "\n\n".join(textwrap.dedent(ddl).strip() for ddl in DDL_STATEMENTS)
+    path.write_text(header + "\n" + body + "\n")
+    logger.info("Wrote %s", path)
+
+
 if __name__ == "__main__":
-    bootstrap_db()
+    parser = argparse.ArgumentParser(description="Bootstrap the Postgres schema.")
+    parser.add_argument(
+        "--sql",
+        action="store_true",
+        help="write bootstrap_schema.sql instead of applying the DDL",
+    )
+    if parser.parse_args().sql:
+        write_schema_sql()
+    else:
+        bootstrap_db()
@@ -1,44 +1,215 @@
 -- src/aeropulse/etl/bootstrap_schema.sql
+-- Generated from DDL_STATEMENTS in bootstrap_db.py; do not edit.
+-- Regenerate with: python -m aeropulse.etl.bootstrap_db --sql
 
 CREATE SCHEMA IF NOT EXISTS public;
 
 CREATE TABLE IF NOT EXISTS public.cities_us (
-  city_id  INTEGER PRIMARY KEY,
-  name     TEXT,
-  state    TEXT,
-  country  TEXT,
-  lat      DOUBLE PRECISION,
-  lon      DOUBLE PRECISION
+    city_id     INTEGER PRIMARY KEY,
+    name        TEXT,
+    state       TEXT,
+    country     TEXT,
+    lat         DOUBLE PRECISION,
+    lon         DOUBLE PRECISION
 );
+
 ALTER TABLE public.cities_us ADD COLUMN IF NOT EXISTS h3_res6 TEXT;
+
+ALTER TABLE public.cities_us ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
 CREATE INDEX IF NOT EXISTS idx_cities_us_h3_res6 ON public.cities_us(h3_res6);
 
 CREATE TABLE IF NOT EXISTS public.weather_res6 (
-  h3_res6      TEXT PRIMARY KEY,
-  last_updated TIMESTAMPTZ,
-  weather      JSONB
+    h3_res6      TEXT PRIMARY KEY,
+    last_updated TIMESTAMPTZ,
+    weather      JSONB
 );
+
 CREATE INDEX IF NOT EXISTS idx_weather_res6_last_updated ON public.weather_res6(last_updated);
 
 CREATE TABLE IF NOT EXISTS public.weather_res6_history (
-  id      BIGSERIAL PRIMARY KEY,
-  h3_res6 TEXT NOT NULL REFERENCES public.weather_res6(h3_res6) ON DELETE CASCADE,
-  ts      TIMESTAMPTZ NOT NULL,
-  weather JSONB
+    id       BIGSERIAL PRIMARY KEY,
+    h3_res6  TEXT NOT NULL,
+    ts       TIMESTAMPTZ NOT NULL,
+    weather  JSONB,
+    CONSTRAINT fk_wres6_hist_cell
+        FOREIGN KEY (h3_res6) REFERENCES public.weather_res6(h3_res6)
+        ON DELETE CASCADE
 );
+
 CREATE INDEX IF NOT EXISTS idx_weather_res6_history_h3_ts ON public.weather_res6_history (h3_res6, ts DESC);
 
 CREATE TABLE IF NOT EXISTS public.flight_weather_hits (
-  id              BIGSERIAL PRIMARY KEY,
-  icao24          TEXT NOT NULL,
-  call_sign       TEXT,
-  ts              TIMESTAMPTZ NOT NULL,
-  lat             DOUBLE PRECISION,
-  lon             DOUBLE PRECISION,
-  h3_res6         TEXT,
-  weather_kind    TEXT,
-  weather_temp_k  DOUBLE PRECISION,
-  raw_weather     JSONB
-);
-CREATE INDEX IF NOT EXISTS idx_fwh_icao24_ts ON public.flight_weather_hits (icao24, ts);
-CREATE INDEX IF NOT EXISTS idx_fwh_h3_ts    ON public.flight_weather_hits (h3_res6, ts);
+    id               BIGSERIAL PRIMARY KEY,
+    icao24           TEXT NOT NULL,
+    callsign         TEXT,
+    t                TIMESTAMPTZ NOT NULL,
+    lat              DOUBLE PRECISION,
+    lon              DOUBLE PRECISION,
+    h3_res6          TEXT,
+    weather_h3_res6  TEXT,
+    weather_ts       TIMESTAMPTZ,
+    weather          JSONB
+);
+
+DO $$
+DECLARE
+    r RECORD;
+BEGIN
+    FOR r IN
+        SELECT * FROM (VALUES ('call_sign', 'callsign'), ('ts', 't'), ('raw_weather', 'weather')) AS v(old, new)
+    LOOP
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'flight_weather_hits'
+              AND column_name = r.old
+        ) AND NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'flight_weather_hits'
+              AND column_name = r.new
+        ) THEN
+            EXECUTE format('ALTER TABLE public.flight_weather_hits RENAME COLUMN %I TO %I', r.old, r.new);
+        END IF;
+    END LOOP;
+END $$;
+
+ALTER TABLE public.flight_weather_hits
+    DROP COLUMN IF EXISTS weather_kind,
+    DROP COLUMN IF EXISTS weather_temp_k,
+    DROP COLUMN IF EXISTS raw_weather,
+    ADD COLUMN IF NOT EXISTS weather_h3_res6 TEXT,
+    ADD COLUMN IF NOT EXISTS weather_ts TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS weather JSONB;
+
+CREATE INDEX IF NOT EXISTS idx_fwh_icao24_ts ON public.flight_weather_hits (icao24, t);
+
+CREATE INDEX IF NOT EXISTS idx_fwh_h3_ts    ON public.flight_weather_hits (h3_res6, t);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE schemaname = 'public' AND indexname = 'uq_fwh_icao24_t_h3'
+    ) THEN
+        DELETE FROM public.flight_weather_hits a
+        USING public.flight_weather_hits b
+        WHERE a.icao24 = b.icao24 AND a.t = b.t AND a.h3_res6 = b.h3_res6
+          AND a.ctid < b.ctid;
+        CREATE UNIQUE INDEX uq_fwh_icao24_t_h3
+            ON public.flight_weather_hits (icao24, t, h3_res6);
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS public.opensky_states (
+    id             BIGSERIAL PRIMARY KEY,
+    ts             TIMESTAMPTZ NOT NULL,
+    icao24         TEXT NOT NULL,
+    callsign       TEXT,
+    lat            DOUBLE PRECISION,
+    lon            DOUBLE PRECISION,
+    h3_res6        TEXT,
+    on_ground      BOOLEAN,
+    velocity       DOUBLE PRECISION,
+    heading        DOUBLE PRECISION,
+    vert_rate      DOUBLE PRECISION,
+    geo_altitude   DOUBLE PRECISION,
+    baro_altitude  DOUBLE PRECISION
+);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE schemaname = 'public' AND indexname = 'uq_opensky_states_icao24_ts'
+    ) THEN
+        DELETE FROM public.opensky_states a
+        USING public.opensky_states b
+        WHERE a.icao24 = b.icao24 AND a.ts = b.ts AND a.ctid < b.ctid;
+        CREATE UNIQUE INDEX uq_opensky_states_icao24_ts
+            ON public.opensky_states (icao24, ts);
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_opensky_states_ts ON public.opensky_states (ts);
+
+CREATE TABLE IF NOT EXISTS public.etl_checkpoints (
+    stage       TEXT PRIMARY KEY,
+    last_id     TEXT,
+    last_ts     TIMESTAMPTZ,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.api_rate_limits (
+    name         TEXT PRIMARY KEY,
+    tokens       DOUBLE PRECISION NOT NULL,
+    refilled_at  TIMESTAMPTZ NOT NULL,
+    day          DATE NOT NULL,
+    day_used     INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS public.weather_cache (
+    h3_res6     TEXT NOT NULL,
+    units       TEXT NOT NULL,
+    lat         DOUBLE PRECISION,
+    lon         DOUBLE PRECISION,
+    fetched_at  TIMESTAMPTZ NOT NULL,
+    payload     JSONB NOT NULL,
+    PRIMARY KEY (h3_res6, units)
+);
+
+CREATE TABLE IF NOT EXISTS public.weather_cache_claims (
+    h3_res6        TEXT NOT NULL,
+    units          TEXT NOT NULL,
+    claimed_until  TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (h3_res6, units)
+);
+
+CREATE TABLE IF NOT EXISTS public.weather_refresh_queue (
+    h3_res6      TEXT PRIMARY KEY,
+    priority     DOUBLE PRECISION NOT NULL,
+    reason       TEXT NOT NULL,
+    enqueued_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_weather_refresh_queue_priority ON public.weather_refresh_queue (priority DESC);
+
+CREATE TABLE IF NOT EXISTS public.weather_cell_map (
+    h3_res6         TEXT PRIMARY KEY,
+    source_h3_res6  TEXT NOT NULL,
+    coverage_res    SMALLINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_weather_cell_map_source ON public.weather_cell_map (source_h3_res6);
+
+ALTER TABLE public.weather_res6
+    ADD COLUMN IF NOT EXISTS wx_main TEXT GENERATED ALWAYS AS (weather->'weather'->0->>'main') STORED,
+    ADD COLUMN IF NOT EXISTS wx_temp DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'main'->>'temp')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_wind_speed DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'wind'->>'speed')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_wind_gust DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'wind'->>'gust')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_visibility DOUBLE PRECISION GENERATED ALWAYS AS ((weather->>'visibility')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_clouds DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'clouds'->>'all')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_pressure DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'main'->>'pressure')::double precision) STORED;
+
+ALTER TABLE public.weather_res6_history
+    ADD COLUMN IF NOT EXISTS wx_main TEXT GENERATED ALWAYS AS (weather->'weather'->0->>'main') STORED,
+    ADD COLUMN IF NOT EXISTS wx_temp DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'main'->>'temp')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_wind_speed DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'wind'->>'speed')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_wind_gust DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'wind'->>'gust')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_visibility DOUBLE PRECISION GENERATED ALWAYS AS ((weather->>'visibility')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_clouds DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'clouds'->>'all')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_pressure DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'main'->>'pressure')::double precision) STORED;
+
+ALTER TABLE public.flight_weather_hits
+    ADD COLUMN IF NOT EXISTS wx_main TEXT GENERATED ALWAYS AS (weather->'weather'->0->>'main') STORED,
+    ADD COLUMN IF NOT EXISTS wx_temp DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'main'->>'temp')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_wind_speed DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'wind'->>'speed')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_wind_gust DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'wind'->>'gust')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_visibility DOUBLE PRECISION GENERATED ALWAYS AS ((weather->>'visibility')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_clouds DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'clouds'->>'all')::double precision) STORED,
+    ADD COLUMN IF NOT EXISTS wx_pressure DOUBLE PRECISION GENERATED ALWAYS AS ((weather->'main'->>'pressure')::double precision) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_weather_res6_wx_main ON public.weather_res6 (wx_main);
+
+CREATE INDEX IF NOT EXISTS idx_weather_res6_history_wx_main_ts ON public.weather_res6_history (wx_main, ts);
+
+CREATE INDEX IF NOT EXISTS idx_fwh_wx_main ON public.flight_weather_hits (wx_main);
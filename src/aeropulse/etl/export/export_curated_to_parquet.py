@@ -1,14 +1,11 @@
 import os
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from datetime import datetime
 
-# pull DSN from env
-dsn = os.getenv("POSTGRES_DSN") or os.getenv("DATABASE_URL")
-if not dsn:
-    raise RuntimeError("Set POSTGRES_DSN or DATABASE_URL")
+from aeropulse.etl.load.loader.pg_loader import get_engine
 
-engine = create_engine(dsn, future=True)
+engine = get_engine()
 
 # make processed_data/run_id folder
 run_id = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
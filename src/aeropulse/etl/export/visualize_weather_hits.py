@@ -17,21 +17,8 @@ weather_path = os.path.join(latest, "weather_res6.parquet")
 if not os.path.exists(weather_path):
     raise RuntimeError("weather_res6.parquet not found in latest run folder")
 
-df = pd.read_parquet(weather_path)
-
-# If JSON column 'weather' exists, flatten a few fields
-if "weather" in df.columns:
-    import json
-
-    def parse_main(payload):
-        try:
-            obj = payload if isinstance(payload, dict) else json.loads(payload)
-            if "weather" in obj and obj["weather"]:
-                return obj["weather"][0].get("main")
-        except Exception:
-            return None
-
-    df["wx_main"] = df["weather"].apply(parse_main)
+# typed columns only; the JSON payload is never read
+df = pd.read_parquet(weather_path, columns=["wx_main", "wx_temp"])
 
 # --- Simple plots ---
 plt.figure(figsize=(8, 4))
@@ -40,8 +27,8 @@ plt.title("Weather condition counts (latest snapshot)")
 plt.tight_layout()
 plt.show()
 
-if "temp_k" in df.columns:
+if df["wx_temp"].notna().any():
     plt.figure()
-    df["temp_k"].hist(bins=40)
-    plt.title("Temperature distribution (Kelvin)")
+    df["wx_temp"].hist(bins=40)
+    plt.title("Temperature distribution")
     plt.show()
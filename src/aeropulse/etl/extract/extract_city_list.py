@@ -4,6 +4,7 @@ from pathlib import Path
 from dotenv import load_dotenv
 import gzip
 import json
+import shutil
 from aeropulse.utils import setup_logger
 
 load_dotenv()
@@ -13,36 +14,87 @@ Path(DOWNLOAD_DIR).mkdir(parents=True, exist_ok=True)
 
 logger = setup_logger("extract_cities.log")
 
+CHUNK_SIZE = 1 << 16
+
+
+def _meta_path(file_path: Path) -> Path:
+    return file_path.with_name(file_path.name + ".meta.json")
+
+
+def _load_meta(file_path: Path) -> dict:
+    """ETag / Last-Modified saved from the previous successful download."""
+    meta = _meta_path(file_path)
+    if not file_path.exists() or not meta.exists():
+        return {}
+    try:
+        return json.loads(meta.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
 
 def save_bulk_cities_data(
     url: str = "http://bulk.openweathermap.org/sample/city.list.json.gz",
+    force: bool = False,
 ):
     """
     Downloads the gzipped city list (with city names, latitude, longitude)
     and saves to DOWNLOAD_DIR
+
+    The body is streamed to disk in chunks. Unless `force` is set, the
+    request is conditional (If-None-Match / If-Modified-Since), so an
+    unchanged upstream file answers 304 and the local copy is kept.
+
     Arg:
     url (str): url of bulk city zip file in openweather data source
+    force (bool): ignore the cached ETag / Last-Modified
 
     Returns:
-        file path of the downloaded gzip file
+        file path of the downloaded (or unchanged) gzip file
     """
 
+    file_path = Path(DOWNLOAD_DIR) / "city_list_json.gz"
+    meta = {} if force else _load_meta(file_path)
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
     try:
         logger.info(f"Starting download from {url}")
-        response = requests.get(url, timeout=30)
-
-        if response.status_code == 200:
-            file_path = Path(DOWNLOAD_DIR) / "city_list_json.gz"
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-
-            logger.info(
-                f"Successfully downloaded {file_path} ({len(response.content)} bytes)"
+        with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+            if response.status_code == 304:
+                logger.info(f"City list unchanged upstream, keeping {file_path}")
+                return file_path
+
+            if response.status_code != 200:
+                logger.error(f"Failed to download. Status code: {response.status_code}")
+                return None
+
+            tmp_path = file_path.with_name(file_path.name + ".part")
+            size = 0
+            try:
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+                os.replace(tmp_path, file_path)
+            finally:
+                # a failed or interrupted download must not leave a partial file
+                tmp_path.unlink(missing_ok=True)
+
+            _meta_path(file_path).write_text(
+                json.dumps(
+                    {
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                    }
+                ),
+                encoding="utf-8",
             )
-            return file_path
-        else:
-            logger.error(f"Failed to download. Status code: {response.status_code}")
-            return None
+
+        logger.info(f"Successfully downloaded {file_path} ({size} bytes)")
+        return file_path
 
     except Exception as e:
         logger.exception(f"Error occurred while downloading: {e}")
@@ -51,7 +103,11 @@ def save_bulk_cities_data(
 
 def extract_gzip_to_json(gz_path, json_path=None):
     """
-    Extracts a gzip-compressed JSON file (.gz) into a readable JSON file.
+    Decompresses a gzip-compressed JSON file (.gz) into a plain JSON file.
+
+    Loaders read the .gz directly, so this is only needed for manual
+    inspection. The bytes are streamed through unchanged (no parse or
+    re-indent pass).
 
     Args:
         gz_path : Path to the .gz file
@@ -68,19 +124,16 @@ def extract_gzip_to_json(gz_path, json_path=None):
         json_path = gz_file.with_suffix("")
         json_path = json_path.with_suffix(".json")
 
-    with gzip.open(gz_file, "rt", encoding="utf-8") as f:
-        data = json.load(f)
-
-    with open(json_path, "w", encoding="utf-8") as json_file:
-        json.dump(data, json_file, indent=2, ensure_ascii=False)
+    with gzip.open(gz_file, "rb") as src, open(json_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
 
     return Path(json_path)
 
 
 if __name__ == "__main__":
-    gz_file = save_bulk_cities_data()
+    force = os.getenv("FORCE_EXTRACT", "false").lower() in ("1", "true", "yes")
+    gz_file = save_bulk_cities_data(force=force)
     if gz_file:
-        json_file = extract_gzip_to_json(gz_file)
-        logger.info(f"Extracted JSON saved at: {json_file}")
+        logger.info(f"City list ready at: {gz_file}")
     else:
         logger.error("Download failed. Check logs for details.")
@@ -1,25 +1,32 @@
 # src/aeropulse/etl/extract/opensky/fetch_us_states.py
 
+import math
 import os
-import time
-from datetime import datetime, timezone
-from typing import Dict, List
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from dotenv import load_dotenv
 from pymongo import ASCENDING, DESCENDING
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
 
 from aeropulse.utils.logging_config import setup_logger
+from aeropulse.utils.rate_limit import DailyBudget
 from aeropulse.etl.load.loader.mongo_loader import (
     get_collection,
     create_indexes,
     insert_batch,
 )
-from aeropulse.services.opensky_client import get_states_all
+from aeropulse.services.opensky_client import stream_states_all
 
 load_dotenv()
 logger = setup_logger(__name__)
 
 COLLECTION = "opensky_states_raw"
+# one pointer per bbox_id to the chunk docs of its latest snapshot
+LATEST_COLLECTION = "opensky_states_latest"
 
 # Rough tiling of CONUS; tweak as needed
 US_TILES: List[Dict] = [
@@ -37,6 +44,127 @@ US_TILES: List[Dict] = [
     {"bbox_id": "SE2", "lamin": 24.0, "lomin": -80.0, "lamax": 32.0, "lomax": -66.5},
 ]
 
+# OpenSky credit cost of one /states/all call by bbox area (square degrees)
+_CREDIT_STEPS = ((25.0, 1), (100.0, 2), (400.0, 3))
+
+
+def tile_credits(tile: Dict) -> int:
+    area = (tile["lamax"] - tile["lamin"]) * (tile["lomax"] - tile["lomin"])
+    for limit, cost in _CREDIT_STEPS:
+        if area <= limit:
+            return cost
+    return 4
+
+
+def _base_tile_of(lat: float, lon: float) -> Optional[str]:
+    for t in US_TILES:
+        if t["lamin"] <= lat < t["lamax"] and t["lomin"] <= lon < t["lomax"]:
+            return t["bbox_id"]
+    return None
+
+
+def _base_tile_counts(states: Iterable[list]) -> Dict[str, int]:
+    """States per base tile, so density survives any split/merge of the fetch tiles."""
+    counts: Dict[str, int] = {}
+    for s in states:
+        lon, lat = s[5], s[6]
+        if lat is None or lon is None:
+            continue
+        bid = _base_tile_of(lat, lon)
+        if bid is not None:
+            counts[bid] = counts.get(bid, 0) + 1
+    return counts
+
+
+def _recent_counts(lookback_min: int) -> Dict[str, int]:
+    """Base-tile state counts from the most recent sweep within the lookback."""
+    coll = get_collection(COLLECTION)
+    since = datetime.now(tz=timezone.utc) - timedelta(minutes=lookback_min)
+    last = coll.find_one(
+        {"fetched_at": {"$gte": since}, "tile_counts": {"$exists": True}},
+        {"fetched_at": 1},
+        sort=[("fetched_at", DESCENDING)],
+    )
+    if not last:
+        return {}
+    counts: Dict[str, int] = {}
+    for doc in coll.find({"fetched_at": last["fetched_at"]}, {"tile_counts": 1}):
+        for bid, n in (doc.get("tile_counts") or {}).items():
+            counts[bid] = counts.get(bid, 0) + int(n)
+    return counts
+
+
+def _split(tile: Dict, n: int) -> List[Dict]:
+    """Cut a tile into n strips along its longer side."""
+    if n <= 1:
+        return [tile]
+    lat_span = tile["lamax"] - tile["lamin"]
+    lon_span = tile["lomax"] - tile["lomin"]
+    out = []
+    for i in range(n):
+        t = dict(tile, bbox_id=f"{tile['bbox_id']}/{i}")
+        if lon_span >= lat_span:
+            t["lomin"] = tile["lomin"] + lon_span * i / n
+            t["lomax"] = tile["lomin"] + lon_span * (i + 1) / n
+        else:
+            t["lamin"] = tile["lamin"] + lat_span * i / n
+            t["lamax"] = tile["lamin"] + lat_span * (i + 1) / n
+        out.append(t)
+    return out
+
+
+def _mergeable(a: Dict, b: Dict) -> bool:
+    """True if a and b share a full edge, i.e. their union is a rectangle."""
+    same_lat = a["lamin"] == b["lamin"] and a["lamax"] == b["lamax"]
+    same_lon = a["lomin"] == b["lomin"] and a["lomax"] == b["lomax"]
+    return (same_lat and (a["lomax"] == b["lomin"] or b["lomax"] == a["lomin"])) or (
+        same_lon and (a["lamax"] == b["lamin"] or b["lamax"] == a["lamin"])
+    )
+
+
+def plan_tiles(
+    counts: Dict[str, int], split_above: int, merge_below: int, max_split: int = 4
+) -> List[Tuple[Dict, int]]:
+    """
+    Adapt US_TILES to recent density: split tiles above `split_above` states
+    into strips, and greedily merge edge-sharing pairs whose combined count
+    is below `merge_below` (when that does not cost more credits).
+    Returns (tile, expected_states) pairs; without history the base tiles
+    are used as-is.
+    """
+    tiles: List[Tuple[Dict, int]] = [(t, counts.get(t["bbox_id"], 0)) for t in US_TILES]
+    if not counts:
+        return tiles
+
+    merged: List[Tuple[Dict, int]] = []
+    used: Set[int] = set()
+    for i, (a, na) in enumerate(tiles):
+        if i in used:
+            continue
+        for j in range(i + 1, len(tiles)):
+            b, nb = tiles[j]
+            if j in used or na + nb >= merge_below or not _mergeable(a, b):
+                continue
+            union = {
+                "bbox_id": f"{a['bbox_id']}+{b['bbox_id']}",
+                "lamin": min(a["lamin"], b["lamin"]),
+                "lomin": min(a["lomin"], b["lomin"]),
+                "lamax": max(a["lamax"], b["lamax"]),
+                "lomax": max(a["lomax"], b["lomax"]),
+            }
+            if tile_credits(union) > tile_credits(a) + tile_credits(b):
+                continue
+            a, na = union, na + nb
+            used.add(j)
+            break
+        merged.append((a, na))
+
+    out: List[Tuple[Dict, int]] = []
+    for t, n in merged:
+        parts = min(max_split, math.ceil(n / split_above)) if split_above > 0 else 1
+        out.extend((p, n // max(1, parts)) for p in _split(t, parts))
+    return out
+
 
 def _ensure_indexes():
     coll = get_collection(COLLECTION)
@@ -49,45 +177,198 @@ def _ensure_indexes():
         ],
         background=True,
     )
+    # latest snapshot of a bbox without the pointers (rebuilds, ad-hoc queries)
+    coll.create_index(
+        [("bbox_id", ASCENDING), ("fetched_at", DESCENDING)], background=True
+    )
+    create_indexes(
+        get_collection(LATEST_COLLECTION), [("fetched_at", DESCENDING)], background=True
+    )
+
+
+def _advance_latest(
+    latest: Collection,
+    tile: Dict,
+    fetched_at: datetime,
+    snap_time: Optional[int],
+    doc_ids: List,
+    n_states: int,
+) -> bool:
+    """
+    Point tile's bbox_id at this snapshot's chunk docs, unless a newer sweep
+    already did. Called once all chunks are inserted, so readers never see a
+    partial snapshot. Returns False if the pointer was already newer.
+    """
+    try:
+        latest.update_one(
+            {"_id": tile["bbox_id"], "fetched_at": {"$lt": fetched_at}},
+            {
+                "$set": {
+                    "bbox": {k: tile[k] for k in ("lamin", "lomin", "lamax", "lomax")},
+                    "fetched_at": fetched_at,
+                    "time": snap_time,
+                    "doc_ids": doc_ids,
+                    "n_states": n_states,
+                }
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # the filter missed on an existing _id: a newer sweep owns the pointer
+        return False
+    return True
+
+
+def _retire_pointers(
+    latest: Collection, active: List[str], fetched_at: datetime
+) -> int:
+    """
+    Drop pointers of bboxes this sweep's plan no longer uses (split, merged
+    or capped away), so their snapshots never overlap the new tiles. Planned
+    tiles skipped for credits keep their last pointer.
+    """
+    res = latest.delete_many(
+        {"_id": {"$nin": active}, "fetched_at": {"$lt": fetched_at}}
+    )
+    if res.deleted_count:
+        logger.info(
+            "Retired %d pointers of bboxes no longer planned.", res.deleted_count
+        )
+    return res.deleted_count
+
+
+class _SeenAircraft:
+    """icao24s already stored in this sweep, shared by the tile workers."""
+
+    def __init__(self):
+        self._seen: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def keep_new(self, states: List[list]) -> List[list]:
+        with self._lock:
+            out = []
+            for s in states:
+                if s[0] in self._seen:
+                    continue
+                self._seen.add(s[0])
+                out.append(s)
+            return out
+
+
+def _fetch_tile(
+    tile: Dict,
+    pacer: DailyBudget,
+    coll: Collection,
+    latest: Collection,
+    seen: _SeenAircraft,
+    fetched_at: datetime,
+    states_per_doc: int,
+) -> Tuple[int, int, Optional[int]]:
+    """
+    Stream one tile's /states/all response into compact chunk documents of
+    at most `states_per_doc` states, each carrying the shared snapshot
+    metadata, so a dense tile never becomes one oversized BSON document,
+    then move the tile's latest-snapshot pointer to them.
+    Returns (docs inserted, states kept, snapshot time).
+    """
+    pacer.wait_min_interval()
+    doc_ids: List = []
+    kept = 0
+    snap_time = None
+    for chunk, (meta, batch) in enumerate(
+        stream_states_all(
+            lamin=tile["lamin"],
+            lomin=tile["lomin"],
+            lamax=tile["lamax"],
+            lomax=tile["lomax"],
+            extended=True,
+            batch_size=states_per_doc,
+        )
+    ):
+        # an aircraft on a shared edge is returned by both tiles; keep the first
+        states = seen.keep_new(batch)
+        snap_time = meta.get("time")
+        doc = {
+            "bbox_id": tile["bbox_id"],
+            "bbox": {k: tile[k] for k in ("lamin", "lomin", "lamax", "lomax")},
+            "fetched_at": fetched_at,
+            **meta,
+            "chunk": chunk,
+            "states": states,
+            "n_states": len(states),
+            "tile_counts": _base_tile_counts(states),
+        }
+        insert_batch(coll, [doc])
+        doc_ids.append(doc["_id"])
+        kept += len(states)
+    _advance_latest(latest, tile, fetched_at, snap_time, doc_ids, kept)
+    return len(doc_ids), kept, snap_time
 
 
 def main():
     _ensure_indexes()
 
-    max_tiles = int(os.getenv("OPENSKY_MAX_TILES_PER_RUN", "6"))
+    credit_budget = int(os.getenv("OPENSKY_CREDITS_PER_RUN", "60"))
+    max_tiles = int(os.getenv("OPENSKY_MAX_TILES_PER_RUN", "0"))  # 0 = no cap
+    concurrency = max(1, int(os.getenv("OPENSKY_CONCURRENCY", "4")))
     sleep_sec = float(os.getenv("OPENSKY_SLEEP_BETWEEN_CALLS", "0.5"))
+    split_above = int(os.getenv("OPENSKY_SPLIT_ABOVE_STATES", "1500"))
+    merge_below = int(os.getenv("OPENSKY_MERGE_BELOW_STATES", "200"))
+    lookback = int(os.getenv("OPENSKY_TILING_LOOKBACK_MIN", "60"))
+
+    # densest tiles first, so a tight credit budget still covers the busy airspace
+    plan = sorted(
+        plan_tiles(_recent_counts(lookback), split_above, merge_below),
+        key=lambda p: p[1],
+        reverse=True,
+    )
+    if max_tiles > 0:
+        plan = plan[:max_tiles]
 
+    # spend credits up front; the shared pacer spaces calls across workers
+    pacer = DailyBudget(daily_limit=credit_budget, min_interval_sec=sleep_sec)
+    tiles = [t for t, _ in plan if pacer.try_consume(tile_credits(t))]
+    if len(tiles) < len(plan):
+        logger.warning(
+            "Credit budget %d covers %d/%d tiles this run.",
+            credit_budget,
+            len(tiles),
+            len(plan),
+        )
+
+    states_per_doc = int(os.getenv("OPENSKY_STATES_PER_DOC", "1000"))
+    coll = get_collection(COLLECTION)
+    latest = get_collection(LATEST_COLLECTION)
     fetched_at = datetime.now(tz=timezone.utc)
     total = 0
+    seen = _SeenAircraft()
 
-    for i, tile in enumerate(US_TILES):
-        if i >= max_tiles:
-            break
-        try:
-            data = get_states_all(
-                lamin=tile["lamin"],
-                lomin=tile["lomin"],
-                lamax=tile["lamax"],
-                lomax=tile["lomax"],
-                extended=True,
-            )
-        except Exception as e:
-            logger.warning("OpenSky error for %s: %s", tile["bbox_id"], e)
-            time.sleep(sleep_sec)
-            continue
-
-        doc = {"bbox_id": tile["bbox_id"], "fetched_at": fetched_at, **data}
-        total += insert_batch(get_collection(COLLECTION), [doc])
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(
+                _fetch_tile, t, pacer, coll, latest, seen, fetched_at, states_per_doc
+            ): t
+            for t in tiles
+        }
+        for fut in as_completed(futures):
+            tile = futures[fut]
+            try:
+                docs, kept, snap_time = fut.result()
+            except Exception as e:
+                logger.warning("OpenSky error for %s: %s", tile["bbox_id"], e)
+                continue
+            total += docs
 
-        logger.info(
-            "Fetched states for %s: t=%s, rows=%s",
-            tile["bbox_id"],
-            data.get("time"),
-            len(data.get("states") or []),
-        )
-        time.sleep(sleep_sec)
+            logger.info(
+                "Fetched states for %s: t=%s, rows=%s, docs=%s",
+                tile["bbox_id"],
+                snap_time,
+                kept,
+                docs,
+            )
 
     logger.info("Inserted %d OpenSky state snapshots into Mongo.", total)
+    _retire_pointers(latest, [t["bbox_id"] for t, _ in plan], fetched_at)
 
 
 if __name__ == "__main__":
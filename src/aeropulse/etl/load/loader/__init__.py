@@ -7,10 +7,16 @@ from .mongo_loader import (
     insert_batch,
     latest_docs_by_keys,
     load_json_array_to_mongo,
+    sync_json_array_to_mongo,
+    content_hash,
 )
 
 from .pg_loader import (
+    bulk_update,
+    bulk_upsert,
     get_engine,
+    get_checkpoint,
+    set_checkpoint,
     masked_dsn_for_log,
     upsert_jsonb_rows,
 )
@@ -22,7 +28,13 @@ __all__ = [
     "insert_batch",
     "latest_docs_by_keys",
     "load_json_array_to_mongo",
+    "sync_json_array_to_mongo",
+    "content_hash",
+    "bulk_update",
+    "bulk_upsert",
     "get_engine",
+    "get_checkpoint",
+    "set_checkpoint",
     "masked_dsn_for_log",
     "upsert_jsonb_rows",
 ]
@@ -1,21 +1,68 @@
 # src/aeropulse/etl/load/loader/pg_loader.py
 
 import os
-from typing import Iterable, Mapping, Any
+import json
+import threading
+from datetime import date, datetime
+from typing import Iterable, Iterator, List, Mapping, Any, Dict, Optional, Sequence
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.engine.url import make_url
 
 load_dotenv()
 
+_engine: Optional[Engine] = None
+_engine_pid: Optional[int] = None
+_engine_lock = threading.Lock()
+
+
+def _engine_options(dsn: str) -> Dict[str, Any]:
+    """
+    Pool and driver settings from env:
+      - PG_POOL_SIZE / PG_MAX_OVERFLOW / PG_POOL_RECYCLE_SEC
+      - PG_POOL_PRE_PING (default true)
+      - PG_STATEMENT_TIMEOUT_MS (0/unset = server default)
+    psycopg2 additionally gets executemany_mode="values_plus_batch", so
+    conn.execute(sql, list_of_dicts) is sent as multi-row VALUES pages.
+    """
+    opts: Dict[str, Any] = {
+        "pool_size": int(os.getenv("PG_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("PG_MAX_OVERFLOW", "10")),
+        "pool_recycle": int(os.getenv("PG_POOL_RECYCLE_SEC", "1800")),
+        "pool_pre_ping": os.getenv("PG_POOL_PRE_PING", "true").lower()
+        in ("1", "true", "yes"),
+    }
+    url = make_url(dsn)
+    if url.get_backend_name() == "postgresql" and url.get_driver_name() == "psycopg2":
+        opts["executemany_mode"] = "values_plus_batch"
+        timeout_ms = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", "0"))
+        if timeout_ms > 0:
+            opts["connect_args"] = {"options": f"-c statement_timeout={timeout_ms}"}
+    return opts
+
 
 def get_engine() -> Engine:
-    dsn = os.getenv("POSTGRES_DSN") or os.getenv("DATABASE_URL")
-    if not dsn:
-        raise RuntimeError("Set POSTGRES_DSN or DATABASE_URL")
-    return create_engine(dsn, future=True)
+    """
+    Return the process-wide SQLAlchemy engine, creating it on first use.
+    In a forked child the inherited pool is discarded (not closed) so the
+    parent's connections are never shared.
+    """
+    global _engine, _engine_pid
+    pid = os.getpid()
+    if _engine is not None and _engine_pid == pid:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            dsn = os.getenv("POSTGRES_DSN") or os.getenv("DATABASE_URL")
+            if not dsn:
+                raise RuntimeError("Set POSTGRES_DSN or DATABASE_URL")
+            _engine = create_engine(dsn, future=True, **_engine_options(dsn))
+        elif _engine_pid != pid:
+            _engine.dispose(close=False)
+        _engine_pid = pid
+    return _engine
 
 
 def masked_dsn_for_log() -> str:
@@ -23,6 +70,193 @@ def masked_dsn_for_log() -> str:
     return str(make_url(dsn).set(password="***")) if dsn else "<unset>"
 
 
+# ---- COPY-based bulk upsert -------------------------------------------------
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(v: Any) -> str:
+    """Render one value in COPY text format (NULL, NaN and NaT become \\N)."""
+    if v is None:
+        return "\\N"
+    if isinstance(v, (float, datetime)) and v != v:
+        return "\\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, (dict, list)):
+        v = json.dumps(v)
+    return str(v).translate(_COPY_ESCAPES)
+
+
+class _CopyStream:
+    """File-like reader that encodes rows lazily, so COPY never sees one big buffer."""
+
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+        self._buf = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buf) < size:
+            try:
+                self._buf += next(self._lines).encode("utf-8")
+            except StopIteration:
+                break
+        if size < 0:
+            out, self._buf = self._buf, b""
+        else:
+            out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+
+def _stage_name(table: str) -> str:
+    return f"_stage_{table.rsplit('.', 1)[-1]}"
+
+
+def _run_staged(
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Mapping[str, Any] | Sequence[Any]],
+    merge_sql: str,
+    conn: Optional[Connection],
+    fetch: bool = False,
+) -> int | List[tuple]:
+    """
+    COPY rows into a temp staging table shaped like `columns` of `table`,
+    run `merge_sql` (built against _stage_name(table)) and drop the stage.
+    Returns the merge statement's rowcount (0 if no rows were copied), or
+    with `fetch` the rows it returned.
+    """
+    cols = ", ".join(columns)
+    stage = _stage_name(table)
+    copied = 0
+
+    def lines() -> Iterator[str]:
+        nonlocal copied
+        for r in rows:
+            values = [r.get(c) for c in columns] if isinstance(r, Mapping) else list(r)
+            copied += 1
+            yield "\t".join(_copy_value(v) for v in values) + "\n"
+
+    def run(c: Connection) -> int:
+        cur = c.connection.cursor()
+        try:
+            cur.execute(
+                f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS "
+                f"SELECT {cols} FROM {table} WITH NO DATA"
+            )
+            cur.copy_expert(f"COPY {stage} ({cols}) FROM STDIN", _CopyStream(lines()))
+            merged = [] if fetch else 0
+            if copied:
+                cur.execute(merge_sql)
+                merged = cur.fetchall() if fetch else cur.rowcount
+            cur.execute(f"DROP TABLE {stage}")
+            return merged
+        finally:
+            cur.close()
+
+    if conn is not None:
+        return run(conn)
+    with get_engine().begin() as c:
+        return run(c)
+
+
+def bulk_upsert(
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Mapping[str, Any] | Sequence[Any]],
+    conflict_cols: Optional[Sequence[str]] = None,
+    update_cols: Optional[Sequence[str] | Mapping[str, str]] = None,
+    *,
+    conn: Optional[Connection] = None,
+) -> int:
+    """
+    Stream rows into `table` via COPY ... FROM STDIN and merge them in one statement.
+
+    Rows are mappings keyed by column name or positional sequences in `columns`
+    order. They are copied into a temp staging table shaped like the target
+    and then merged with a single INSERT ... SELECT:
+      - conflict_cols=None: plain append.
+      - conflict_cols set, update_cols empty: ON CONFLICT DO NOTHING.
+      - otherwise: ON CONFLICT (conflict_cols) DO UPDATE SET update_cols;
+        a mapping {column: sql_expr} overrides the default EXCLUDED.column.
+    When a batch repeats a conflict key, the last row wins.
+
+    Pass `conn` to run inside an existing transaction; otherwise one is opened
+    on the shared engine. Returns the number of rows inserted or updated.
+    """
+    cols = ", ".join(columns)
+    stage = _stage_name(table)
+    if conflict_cols:
+        keys = ", ".join(conflict_cols)
+        select_sql = f"SELECT DISTINCT ON ({keys}) {cols} FROM {stage} ORDER BY {keys}, ctid DESC"
+        if update_cols:
+            exprs = (
+                dict(update_cols)
+                if isinstance(update_cols, Mapping)
+                else {c: f"EXCLUDED.{c}" for c in update_cols}
+            )
+            sets = ", ".join(f"{c} = {e}" for c, e in exprs.items())
+            conflict_sql = f"ON CONFLICT ({keys}) DO UPDATE SET {sets}"
+        else:
+            conflict_sql = f"ON CONFLICT ({keys}) DO NOTHING"
+    else:
+        select_sql = f"SELECT {cols} FROM {stage}"
+        conflict_sql = ""
+
+    merge_sql = f"INSERT INTO {table} ({cols}) {select_sql} {conflict_sql}"
+    return _run_staged(table, columns, rows, merge_sql, conn)
+
+
+def bulk_insert_new(
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Mapping[str, Any] | Sequence[Any]],
+    conflict_cols: Sequence[str],
+    *,
+    conn: Optional[Connection] = None,
+) -> List[tuple]:
+    """
+    COPY-staged INSERT ... ON CONFLICT (conflict_cols) DO NOTHING, like
+    bulk_upsert without update_cols, returning the conflict_cols values of
+    the rows actually inserted. Lets a caller that re-reads an overlapping
+    window pass on only what is new (e.g. to an appended Parquet export).
+    """
+    cols = ", ".join(columns)
+    keys = ", ".join(conflict_cols)
+    merge_sql = (
+        f"INSERT INTO {table} ({cols}) "
+        f"SELECT DISTINCT ON ({keys}) {cols} FROM {_stage_name(table)} "
+        f"ORDER BY {keys}, ctid DESC "
+        f"ON CONFLICT ({keys}) DO NOTHING RETURNING {keys}"
+    )
+    return _run_staged(table, columns, rows, merge_sql, conn, fetch=True)
+
+
+def bulk_update(
+    table: str,
+    key_cols: Sequence[str],
+    update_cols: Sequence[str],
+    rows: Iterable[Mapping[str, Any] | Sequence[Any]],
+    *,
+    conn: Optional[Connection] = None,
+) -> int:
+    """
+    Update existing rows of `table` from a COPY-staged batch in one
+    UPDATE ... FROM statement. Rows hold `key_cols` then `update_cols`
+    (positional) or are mappings with those names; keys not present in
+    `table` are ignored. Returns the number of rows updated.
+    """
+    columns = [*key_cols, *update_cols]
+    sets = ", ".join(f"{c} = s.{c}" for c in update_cols)
+    match = " AND ".join(f"t.{k} = s.{k}" for k in key_cols)
+    merge_sql = (
+        f"UPDATE {table} AS t SET {sets} FROM {_stage_name(table)} AS s WHERE {match}"
+    )
+    return _run_staged(table, columns, rows, merge_sql, conn)
+
+
 def upsert_jsonb_rows(
     *,
     table: str,
@@ -34,7 +268,7 @@ def upsert_jsonb_rows(
     """
     Upsert rows into a table with a JSONB payload and timestamp.
     Expects each row to have keys: 'pk', 'payload', 'ts'.
-    INSERT ... ON CONFLICT (pk) DO UPDATE ...
+    COPY into staging, then INSERT ... ON CONFLICT (pk) DO UPDATE ...
     """
     payload = []
     for r in rows:
@@ -43,24 +277,63 @@ def upsert_jsonb_rows(
         ts = r.get("ts")
         if pk is None or data is None or ts is None:
             continue
-        payload.append({"pk": pk, "payload": data, "ts": ts})
+        payload.append((pk, data, ts))
 
     if not payload:
         return 0
 
-    eng = get_engine()
+    bulk_upsert(
+        table,
+        [pk_column, jsonb_column, ts_column],
+        payload,
+        conflict_cols=[pk_column],
+        update_cols=[jsonb_column, ts_column],
+    )
+    return len(payload)
+
+
+# ---- Per-stage watermarks (public.etl_checkpoints) -------------------------
+
+
+def get_checkpoint(
+    stage: str, *, conn: Optional[Connection] = None
+) -> Optional[Dict[str, Any]]:
+    """Return {'last_id', 'last_ts'} for a stage, or None on its first run."""
     sql = text(
-        f"""
-        INSERT INTO {table} ({pk_column}, {jsonb_column}, {ts_column})
-        VALUES (:pk, CAST(:payload AS JSONB), :ts)
-        ON CONFLICT ({pk_column})
-        DO UPDATE SET
-            {jsonb_column} = EXCLUDED.{jsonb_column},
-            {ts_column} = EXCLUDED.{ts_column}
-    """
+        "SELECT last_id, last_ts FROM public.etl_checkpoints WHERE stage = :stage"
     )
+    if conn is not None:
+        row = conn.execute(sql, {"stage": stage}).mappings().first()
+    else:
+        with get_engine().connect() as c:
+            row = c.execute(sql, {"stage": stage}).mappings().first()
+    return dict(row) if row else None
 
-    with eng.begin() as conn:
-        conn.execute(sql, payload)
 
-    return len(payload)
+def set_checkpoint(
+    stage: str,
+    *,
+    last_id: Optional[str] = None,
+    last_ts: Optional[datetime] = None,
+    conn: Optional[Connection] = None,
+) -> None:
+    """
+    Advance a stage's watermark. Pass the same `conn` used for the stage's
+    writes so data and watermark commit atomically.
+    """
+    sql = text(
+        """
+        INSERT INTO public.etl_checkpoints (stage, last_id, last_ts, updated_at)
+        VALUES (:stage, :last_id, :last_ts, now())
+        ON CONFLICT (stage) DO UPDATE SET
+            last_id = EXCLUDED.last_id,
+            last_ts = EXCLUDED.last_ts,
+            updated_at = EXCLUDED.updated_at
+        """
+    )
+    params = {"stage": stage, "last_id": last_id, "last_ts": last_ts}
+    if conn is not None:
+        conn.execute(sql, params)
+        return
+    with get_engine().begin() as c:
+        c.execute(sql, params)
@@ -12,6 +12,7 @@ load_dotenv()
 logger = setup_logger(__name__)
 
 COLLECTION = "opensky_states_raw"
+LATEST_COLLECTION = "opensky_states_latest"
 
 
 def main():
@@ -23,6 +24,9 @@ def main():
     logger.info(
         "Deleted %d OpenSky raw documents older than %d days.", res.deleted_count, days
     )
+    # pointers to snapshots that were just deleted
+    res = get_collection(LATEST_COLLECTION).delete_many({"fetched_at": {"$lt": cutoff}})
+    logger.info("Deleted %d stale latest-snapshot pointers.", res.deleted_count)
 
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 
 from aeropulse.etl.load.loader import (
     load_json_array_to_mongo,
+    sync_json_array_to_mongo,
     get_collection,
     create_indexes,
 )
@@ -22,26 +23,43 @@ def _map_id_to__id(doc: dict) -> dict:
 def main():
     load_dotenv()
 
-    # Prefer explicit env var, fall back to the standard path in repo
+    # Prefer explicit env var, then the downloaded .gz (read directly,
+    # no extracted copy needed), then a legacy extracted .json; both live in
+    # DOWNLOAD_DIR, where extract_city_list writes them
+    download_dir = os.getenv("DOWNLOAD_DIR", os.path.join("data", "raw_data"))
+    default_gz = os.path.join(download_dir, "city_list_json.gz")
+    default_json = os.path.join(download_dir, "city_list_json.json")
     file_path = os.getenv(
         "CITY_LIST_JSON_PATH",
-        os.path.join("data", "raw_data", "city_list_json.json"),
+        default_gz if os.path.exists(default_gz) else default_json,
     )
 
-    # If you keep only the .gz, point env var to it:
-    # CITY_LIST_JSON_PATH=data/raw_data/city_list_json.gz
+    # CITY_SYNC_FULL=true restores the old drop-and-reload behaviour
+    if os.getenv("CITY_SYNC_FULL", "false").lower() in ("1", "true", "yes"):
+        inserted = load_json_array_to_mongo(
+            file_path=file_path,
+            collection_name="cities",
+            batch_size=10000,
+            drop_existing=True,
+            transform=_map_id_to__id,  # <-- use transform instead of map_id_to__id
+            indexes=[("country", 1), ("state", 1)],
+        )
 
-    inserted = load_json_array_to_mongo(
+        # Just a tiny confirmation print; logs (if any) handled by your global config
+        print(f"Inserted {inserted} documents into MongoDB.cities from {file_path}")
+        return
+
+    stats = sync_json_array_to_mongo(
         file_path=file_path,
         collection_name="cities",
         batch_size=10000,
-        drop_existing=True,
-        transform=_map_id_to__id,  # <-- use transform instead of map_id_to__id
+        transform=_map_id_to__id,
         indexes=[("country", 1), ("state", 1)],
     )
-
-    # Just a tiny confirmation print; logs (if any) handled by your global config
-    print(f"Inserted {inserted} documents into MongoDB.cities from {file_path}")
+    print(
+        "Synced MongoDB.cities from {}: {inserted} inserted, {updated} updated, "
+        "{deleted} deleted, {unchanged} unchanged".format(file_path, **stats)
+    )
 
 
 if __name__ == "__main__":
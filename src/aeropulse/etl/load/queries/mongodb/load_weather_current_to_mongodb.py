@@ -1,119 +1,147 @@
 import os
 import logging
-from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any
 
-import h3
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine.url import make_url
 
-from aeropulse.services.openweather_client import OpenWeatherClient
-from aeropulse.utils.rate_limit import DailyBudget, env_daily_budget
+from aeropulse.services.openweather_client import CircuitOpenError, OpenWeatherClient
+from aeropulse.services.weather_cache import CachedWeather, WeatherCache
+from aeropulse.utils.rate_limit import openweather_limiter
 from aeropulse.utils.logging_config import setup_logger
 from aeropulse.etl.load.loader.mongo_loader import (
     get_collection,
     create_indexes,
     insert_batch,
 )
+from aeropulse.etl.load.loader.pg_loader import get_engine, masked_dsn_for_log
+from aeropulse.etl.transform.queries.weather_prefetch import prefetch_along_paths
+from aeropulse.etl.transform.queries.weather_refresh_queue import (
+    claim_cells,
+    schedule_refresh,
+)
 
 logger = setup_logger("load_weather_current_to_mongodb.log")
 logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
 
 
-def h3_to_latlon(cell: str) -> Tuple[float, float]:
-    if hasattr(h3, "h3_to_geo"):
-        lat, lon = h3.h3_to_geo(cell)
-    elif hasattr(h3, "cell_to_latlng"):
-        lat, lon = h3.cell_to_latlng(cell)
-    else:
-        raise RuntimeError("No suitable H3 function found")
-    return float(lat), float(lon)
+def _raw_doc(entry: CachedWeather, units: str) -> Dict[str, Any]:
+    return {
+        "h3_res6": entry.h3_res6,
+        "lat": entry.lat,
+        "lon": entry.lon,
+        "units": units,
+        "source": "openweather_current",
+        "fetched_at": entry.fetched_at,
+        "payload": entry.payload,
+        "cache": entry.source,
+    }
 
 
 def main():
     load_dotenv()
 
-    dsn = os.getenv("POSTGRES_DSN") or os.getenv("DATABASE_URL")
-    if not dsn:
-        raise RuntimeError("Set POSTGRES_DSN or DATABASE_URL")
-    logger.info("Connecting to DB (read cells): %s", make_url(dsn).set(password="***"))
-    engine = create_engine(dsn, future=True)
+    logger.info("Connecting to DB (read cells): %s", masked_dsn_for_log())
+    engine = get_engine()
 
     freshness_minutes = int(os.getenv("WEATHER_FRESH_MINUTES", "30"))
-    cutoff = datetime.now(timezone.utc) - timedelta(minutes=freshness_minutes)
 
-    daily_limit = env_daily_budget(900)
-    min_interval = float(os.getenv("OPENWEATHER_MIN_INTERVAL_SEC", "0.1"))
     per_run_cap = int(os.getenv("WEATHER_UPDATE_BATCH", "500"))
-    budget = DailyBudget(daily_limit=daily_limit, min_interval_sec=min_interval)
-
-    with engine.connect() as conn:
-        rows = conn.execute(
-            text(
-                """
-                SELECT h3_res6
-                FROM public.weather_res6
-                WHERE last_updated IS NULL OR last_updated < :cutoff
-                ORDER BY (last_updated IS NULL) DESC, last_updated ASC
-                LIMIT :lim
-            """
-            ),
-            {"cutoff": cutoff, "lim": min(per_run_cap, budget.remaining())},
-        ).fetchall()
-
-    if not rows:
+    budget = openweather_limiter(engine)
+
+    # highest-value stale cells first (traffic, staleness, volatility, plus
+    # cells flights are about to enter); the queue is shared with
+    # update_weather_for_active_cells
+    schedule_refresh(engine, freshness_minutes)
+    if os.getenv("WEATHER_PREFETCH", "true").lower() in ("1", "true", "yes"):
+        prefetch_along_paths(engine, freshness_minutes)
+    cells = claim_cells(min(per_run_cap, budget.remaining()), engine)
+
+    if not cells:
         logger.info("No stale cells to fetch (freshness=%d min).", freshness_minutes)
         return
 
     coll = get_collection("weather_current_raw")
     create_indexes(coll, [("h3_res6", 1), ("fetched_at", -1)])
 
-    client = OpenWeatherClient()
+    # up to N requests in flight over one pooled session; OPENWEATHER_CONCURRENCY=1 is serial.
+    # In adaptive mode the client shrinks that on 429/5xx and grows it back on success.
+    concurrency = max(1, int(os.getenv("OPENWEATHER_CONCURRENCY", "4")))
+    adaptive = os.getenv("OPENWEATHER_ADAPTIVE", "true").lower() in ("1", "true", "yes")
+    client = OpenWeatherClient(
+        pool_maxsize=concurrency,
+        adaptive=adaptive,
+        breaker_failures=int(os.getenv("OPENWEATHER_BREAKER_FAILURES", "5")),
+        breaker_cooldown_sec=float(os.getenv("OPENWEATHER_BREAKER_COOLDOWN_SEC", "60")),
+    )
     units = os.getenv("OWM_UNITS", "standard")
+    # read through the shared cache: a cell any job fetched within the
+    # freshness window costs no API call
+    cache = WeatherCache(
+        client, engine, freshness_minutes * 60, limiter=budget, units=units
+    )
 
     buffer: List[Dict[str, Any]] = []
     fetched = 0
-
-    for (cell,) in rows:
-        if budget.remaining() <= 0:
-            logger.info("Budget exhausted after %d fetches.", fetched)
-            break
-
-        lat, lon = h3_to_latlon(cell)
-        budget.wait_min_interval()
-
-        try:
-            payload = client.current(lat, lon, units=units)
-        except RuntimeError as e:
-            if "401 Unauthorized" in str(e):
-                logger.error("%s", e)
-                logger.error("Stopping run (bad API key).")
-                break
-            logger.warning("OpenWeather fail for %s (%s,%s): %s", cell, lat, lon, e)
-            continue
-        except Exception as e:
-            logger.warning("OpenWeather error for %s (%s,%s): %s", cell, lat, lon, e)
-            continue
-
-        buffer.append(
-            {
-                "h3_res6": cell,
-                "lat": lat,
-                "lon": lon,
-                "units": units,
-                "source": "openweather_current",
-                "fetched_at": datetime.now(timezone.utc),
-                "payload": payload,
-            }
+    exhausted = False
+    stopped = False
+
+    cached = cache.lookup(cells)
+    buffer.extend(_raw_doc(entry, units) for entry in cached.values())
+    if cached:
+        logger.info(
+            "%d/%d stale cells served from the weather cache.", len(cached), len(cells)
         )
-        fetched += 1
-        budget.consume(1)
 
-        if len(buffer) >= 100:
-            inserted = insert_batch(coll, buffer)
-            logger.info("Inserted %d raw weather docs to Mongo.", inserted)
-            buffer.clear()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pool.submit(cache.get, cell): cell for cell in cells if cell not in cached
+        }
+        # On a fatal error pending requests are cancelled, but the loop keeps
+        # draining: requests already in flight were paid for and their
+        # results still go to Mongo.
+        for fut in as_completed(futures):
+            if fut.cancelled():
+                continue
+            cell = futures[fut]
+            try:
+                entry = fut.result()
+            except CircuitOpenError as e:
+                if not stopped:
+                    logger.error("%s; stopping run.", e)
+                    stopped = True
+                    for f in futures:
+                        f.cancel()
+                continue
+            except RuntimeError as e:
+                if "401 Unauthorized" in str(e):
+                    if not stopped:
+                        logger.error("%s", e)
+                        logger.error("Stopping run (bad API key).")
+                        stopped = True
+                        for f in futures:
+                            f.cancel()
+                    continue
+                logger.warning("OpenWeather fail for %s: %s", cell, e)
+                continue
+            except Exception as e:
+                logger.warning("OpenWeather error for %s: %s", cell, e)
+                continue
+
+            if entry is None:
+                if not exhausted:
+                    logger.info("Budget exhausted after %d fetches.", fetched)
+                    exhausted = True
+                continue
+
+            buffer.append(_raw_doc(entry, units))
+            fetched += 1
+
+            # stream results into Mongo as they complete
+            if len(buffer) >= 100:
+                inserted = insert_batch(coll, buffer)
+                logger.info("Inserted %d raw weather docs to Mongo.", inserted)
+                buffer.clear()
 
     if buffer:
         inserted = insert_batch(coll, buffer)
@@ -1,14 +1,18 @@
 # src/aeropulse/etl/load/queries/postgres/load_city_to_postgres.py
 
 import os
-from typing import Dict, Iterable, Iterator, List
+from typing import Dict, Iterable, Iterator, List, Optional
 
 from dotenv import load_dotenv
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
-from aeropulse.etl.load.loader.mongo_loader import mongo_client
-from aeropulse.etl.load.loader.pg_loader import get_engine, masked_dsn_for_log
+from aeropulse.etl.load.loader.mongo_loader import get_collection
+from aeropulse.etl.load.loader.pg_loader import (
+    bulk_upsert,
+    get_engine,
+    masked_dsn_for_log,
+)
 from aeropulse.utils.logging_config import setup_logger
 
 logger = setup_logger(__name__)
@@ -28,13 +32,9 @@ def _chunk(gen: Iterable[Dict], n: int) -> Iterator[List[Dict]]:
 def _mongo_us_cities(batch_size: int = 5000) -> Iterator[List[Dict]]:
     """
     Stream US cities from Mongo as batches with fields:
-      city_id, name, state, country, lat, lon
+      city_id, name, state, country, lat, lon, content_hash
     """
-    client = mongo_client()
-    dbname = os.getenv("MONGO_DB")
-    if not dbname:
-        raise RuntimeError("MONGO_DB not set")
-    coll = client[dbname]["cities"]
+    coll = get_collection("cities")
 
     cursor = coll.find(
         {"country": "US", "coord.lat": {"$ne": None}, "coord.lon": {"$ne": None}},
@@ -45,6 +45,7 @@ def _mongo_us_cities(batch_size: int = 5000) -> Iterator[List[Dict]]:
             "state": 1,
             "coord.lat": 1,
             "coord.lon": 1,
+            "content_hash": 1,
         },
         no_cursor_timeout=True,
     ).batch_size(batch_size)
@@ -58,34 +59,63 @@ def _mongo_us_cities(batch_size: int = 5000) -> Iterator[List[Dict]]:
                 "country": "US",
                 "lat": d.get("coord", {}).get("lat"),
                 "lon": d.get("coord", {}).get("lon"),
+                "content_hash": d.get("content_hash"),
             }
 
     for b in _chunk(gen(), batch_size):
         yield b
 
 
+def _existing_hashes(engine: Engine) -> Dict[int, Optional[str]]:
+    """city_id -> content_hash of the Mongo doc each Postgres row was loaded from."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT city_id, content_hash FROM public.cities_us")
+        ).fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
 def _upsert_batch(engine: Engine, rows: List[Dict]) -> int:
     """
-    Upsert into public.cities_us:
-      columns: city_id(pk), name, state, country, lat, lon
+    Upsert into public.cities_us (COPY-staged):
+      columns: city_id(pk), name, state, country, lat, lon, content_hash
+    h3_res6 is cleared when coordinates move so gen_h3_cells recomputes it.
     """
-    sql = text(
-        """
-        INSERT INTO public.cities_us (city_id, name, state, country, lat, lon)
-        VALUES (:city_id, :name, :state, :country, :lat, :lon)
-        ON CONFLICT (city_id) DO UPDATE SET
-            name = EXCLUDED.name,
-            state = EXCLUDED.state,
-            country = EXCLUDED.country,
-            lat = EXCLUDED.lat,
-            lon = EXCLUDED.lon
-        """
-    )
     with engine.begin() as conn:
-        conn.execute(sql, rows)
+        bulk_upsert(
+            "public.cities_us",
+            ["city_id", "name", "state", "country", "lat", "lon", "content_hash"],
+            rows,
+            conflict_cols=["city_id"],
+            update_cols={
+                "name": "EXCLUDED.name",
+                "state": "EXCLUDED.state",
+                "country": "EXCLUDED.country",
+                "lat": "EXCLUDED.lat",
+                "lon": "EXCLUDED.lon",
+                "content_hash": "EXCLUDED.content_hash",
+                "h3_res6": (
+                    "CASE WHEN (public.cities_us.lat, public.cities_us.lon)"
+                    " IS DISTINCT FROM (EXCLUDED.lat, EXCLUDED.lon)"
+                    " THEN NULL ELSE public.cities_us.h3_res6 END"
+                ),
+            },
+            conn=conn,
+        )
     return len(rows)
 
 
+def _delete_cities(engine: Engine, city_ids: List[int]) -> int:
+    if not city_ids:
+        return 0
+    with engine.begin() as conn:
+        conn.execute(
+            text("DELETE FROM public.cities_us WHERE city_id = ANY(:ids)"),
+            {"ids": city_ids},
+        )
+    return len(city_ids)
+
+
 def main():
     load_dotenv()
 
@@ -93,12 +123,36 @@ def main():
     logger.info("Connecting to Postgres: %s", masked_dsn_for_log())
     engine = get_engine()
 
+    # Only rows whose Mongo content_hash differs are written, unless
+    # CITY_SYNC_FULL=true forces a full re-upsert.
+    full = os.getenv("CITY_SYNC_FULL", "false").lower() in ("1", "true", "yes")
+    existing = _existing_hashes(engine)
+
     total = 0
+    seen = 0
     for batch in _mongo_us_cities(batch_size=5000):
-        total += _upsert_batch(engine, batch)
-        logger.info("Upserted %d cities (cumulative: %d)", len(batch), total)
-
-    logger.info("Finished upserting cities into Postgres. Total: %d", total)
+        seen += len(batch)
+        changed = [
+            r
+            for r in batch
+            if existing.pop(r["city_id"], None) != r["content_hash"]
+            or r["content_hash"] is None
+            or full
+        ]
+        if not changed:
+            continue
+        total += _upsert_batch(engine, changed)
+        logger.info("Upserted %d cities (cumulative: %d)", len(changed), total)
+
+    # cities left in `existing` no longer exist upstream
+    deleted = _delete_cities(engine, list(existing)) if seen else 0
+
+    logger.info(
+        "Finished syncing cities into Postgres. Upserted: %d, deleted: %d, unchanged: %d",
+        total,
+        deleted,
+        seen - total,
+    )
 
 
 if __name__ == "__main__":
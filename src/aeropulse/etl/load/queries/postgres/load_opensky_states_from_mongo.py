@@ -1,100 +1,181 @@
 import os
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+import numpy as np
 import pandas as pd
-import h3
-from sqlalchemy import text
+from aeropulse.etl.extract.opensky.fetch_us_states import COLLECTION
 from aeropulse.etl.load.loader.mongo_loader import get_collection
-from aeropulse.etl.load.loader.pg_loader import get_engine, masked_dsn_for_log
+from aeropulse.etl.load.loader.pg_loader import (
+    bulk_insert_new,
+    get_checkpoint,
+    get_engine,
+    masked_dsn_for_log,
+    set_checkpoint,
+)
+from aeropulse.utils.h3_utils import latlng_to_cells
 from aeropulse.utils.logging_config import setup_logger
 from aeropulse.utils.parquet_io import write_parquet_partitioned
 
 logger = setup_logger(__name__)
 
+CHECKPOINT_STAGE = "opensky_states_from_mongo"
+# Snapshots are inserted by several fetch workers, so one with an earlier
+# time can land after a later one; each run re-reads this far behind the
+# watermark and the (icao24, ts) conflict key absorbs the overlap.
+WATERMARK_LAG_MIN = int(os.getenv("OPENSKY_LOAD_LAG_MIN", "10"))
 
-def _to_h3(lat, lon):
-    if lat is None or lon is None:
-        return None
-    try:
-        return h3.geo_to_h3(lat, lon, 6)
-    except Exception:
-        return None
+STATE_COLUMNS = [
+    "ts",
+    "icao24",
+    "callsign",
+    "lat",
+    "lon",
+    "h3_res6",
+    "on_ground",
+    "velocity",
+    "heading",
+    "vert_rate",
+    "geo_altitude",
+    "baro_altitude",
+]
+
+# column -> position in an OpenSky REST state vector:
+# [icao24, callsign, origin_country, time_position, last_contact, lon, lat, ...]
+STATE_VECTOR_INDEX = {
+    "icao24": 0,
+    "callsign": 1,
+    "lon": 5,
+    "lat": 6,
+    "baro_altitude": 7,
+    "on_ground": 8,
+    "velocity": 9,
+    "heading": 10,
+    "vert_rate": 11,
+    "geo_altitude": 13,
+}
+
+
+def states_frame(docs: Iterable[Dict]) -> pd.DataFrame:
+    """
+    Turn snapshot docs into one columnar frame with STATE_COLUMNS.
+
+    All state arrays are handed to pandas in one go (short, non-extended
+    vectors are padded with NaN), the snapshot time is broadcast with
+    np.repeat and H3 is computed for the whole lat/lon columns at once.
+    """
+    states: List[list] = []
+    times: List[float] = []
+    counts: List[int] = []
+    for doc in docs:
+        batch = doc.get("states") or []
+        states.extend(batch)
+        times.append(doc["time"])
+        counts.append(len(batch))
+
+    if not states:
+        return pd.DataFrame(columns=STATE_COLUMNS)
+
+    raw = pd.DataFrame(states)
+    df = pd.DataFrame(
+        {
+            name: raw[i] if i in raw.columns else np.nan
+            for name, i in STATE_VECTOR_INDEX.items()
+        }
+    )
+    df["ts"] = pd.to_datetime(np.repeat(times, counts), unit="s", utc=True)
+    df["h3_res6"] = latlng_to_cells(df["lat"], df["lon"], 6)
+    return df[STATE_COLUMNS]
+
+
+class _Watermark:
+    """Pass docs through while remembering the latest snapshot time seen."""
+
+    def __init__(self, docs: Iterable[Dict]):
+        self._docs = docs
+        self.last_time: Optional[float] = None
+        self.count = 0
+
+    def __iter__(self) -> Iterator[Dict]:
+        for doc in self._docs:
+            t = doc.get("time")
+            if t is not None and (self.last_time is None or t > self.last_time):
+                self.last_time = t
+            self.count += 1
+            yield doc
 
 
 def main():
-    # raw collection name you already use for OpenSky snapshots:
-    coll = get_collection("opensky_states")
-    # last 20 minutes window to reduce load
-    now = datetime.now(timezone.utc)
-    since = now.timestamp() - 20 * 60
+    # raw snapshot chunks written by fetch_us_states
+    coll = get_collection(COLLECTION)
+
+    # Snapshots from WATERMARK_LAG_MIN before the last processed OpenSky
+    # time (server clock, not client-generated _ids); the first run falls
+    # back to the last 20 minutes.
+    checkpoint = get_checkpoint(CHECKPOINT_STAGE)
+    last_ts = checkpoint.get("last_ts") if checkpoint else None
+    if last_ts is not None:
+        since = last_ts - timedelta(minutes=WATERMARK_LAG_MIN)
+    else:
+        since = datetime.now(timezone.utc) - timedelta(minutes=20)
 
     cur = coll.find(
-        {"time": {"$gte": since}},
-        projection={"_id": 0, "time": 1, "states": 1},
+        {"time": {"$gte": since.timestamp()}},
+        projection={"_id": 1, "time": 1, "states": 1},
+        sort=[("time", 1)],
         no_cursor_timeout=True,
     )
 
-    rows = []
-    for doc in cur:
-        ts = datetime.fromtimestamp(doc["time"], tz=timezone.utc)
-        for s in doc.get("states", []):
-            # s is the array per OpenSky REST: [icao24, callsign, origin_country, time_position, last_contact, ...]
-            icao24 = s[0]
-            callsign = s[1]
-            lat = s[6]
-            lon = s[5]
-            on_ground = s[8]
-            velocity = s[9]
-            heading = s[10]
-            vert_rate = s[11]
-            baro_altitude = s[7]
-            geo_altitude = s[13] if len(s) > 13 else None
-            cell = _to_h3(lat, lon)
-            rows.append(
-                {
-                    "ts": ts,
-                    "icao24": icao24,
-                    "callsign": callsign,
-                    "lat": lat,
-                    "lon": lon,
-                    "h3_res6": cell,
-                    "on_ground": on_ground,
-                    "velocity": velocity,
-                    "heading": heading,
-                    "vert_rate": vert_rate,
-                    "geo_altitude": geo_altitude,
-                    "baro_altitude": baro_altitude,
-                }
-            )
-
-    if not rows:
+    seen = _Watermark(cur)
+    df = states_frame(seen)
+    if not seen.count:
+        logger.info("No OpenSky snapshots since %s.", since.isoformat())
+        return
+    if seen.last_time is not None:
+        newest = datetime.fromtimestamp(seen.last_time, tz=timezone.utc)
+        last_ts = newest if last_ts is None else max(last_ts, newest)
+    watermark = {"last_ts": last_ts}
+    if df.empty:
+        set_checkpoint(CHECKPOINT_STAGE, **watermark)
         logger.info("No OpenSky rows to load.")
         return
 
-    df = pd.DataFrame(rows)
-    # write Parquet snapshot for offline viz
-    out_dir = os.getenv("PROCESSED_DIR", "data/processed/opensky_states")
-    write_parquet_partitioned(
-        df.assign(dt=df["ts"].dt.strftime("%Y-%m-%d"), hour=df["ts"].dt.strftime("%H")),
-        out_dir,
-        ["dt", "hour"],
-    )
-
-    eng = get_engine()
     logger.info("Writing %d rows to Postgres (%s)", len(df), masked_dsn_for_log())
-    # bulk insert via VALUES
-    sql = text(
-        """
-        INSERT INTO public.opensky_states (
-            ts, icao24, callsign, lat, lon, h3_res6, on_ground, velocity, heading, vert_rate, geo_altitude, baro_altitude
+    # bulk append via COPY, straight from the columns (no per-row dicts);
+    # (icao24, ts) is unique so replays are no-ops, and the watermark
+    # commits in the same transaction as the rows
+    with get_engine().begin() as con:
+        inserted = bulk_insert_new(
+            "public.opensky_states",
+            STATE_COLUMNS,
+            df.itertuples(index=False, name=None),
+            conflict_cols=["icao24", "ts"],
+            conn=con,
         )
-        VALUES (
-            :ts, :icao24, :callsign, :lat, :lon, :h3_res6, :on_ground, :velocity, :heading, :vert_rate, :geo_altitude, :baro_altitude
+        set_checkpoint(CHECKPOINT_STAGE, conn=con, **watermark)
+
+        # Parquet snapshot for offline viz: only rows new to Postgres, since
+        # the lag window re-reads snapshots an earlier run already exported.
+        # Written before commit, so a failure here retries the whole batch.
+        new_keys = pd.DataFrame(inserted, columns=["icao24", "ts"])
+        new_keys["ts"] = pd.to_datetime(new_keys["ts"], utc=True)
+        # a key repeated in the batch was inserted once (last row wins)
+        new = df.drop_duplicates(["icao24", "ts"], keep="last").merge(
+            new_keys, on=["icao24", "ts"]
         )
-    """
+        if not new.empty:
+            out_dir = os.getenv("PROCESSED_DIR", "data/processed/opensky_states")
+            write_parquet_partitioned(
+                new.assign(
+                    dt=new["ts"].dt.strftime("%Y-%m-%d"),
+                    hour=new["ts"].dt.strftime("%H"),
+                ),
+                out_dir,
+                ["dt", "hour"],
+                append=True,
+            )
+    logger.info(
+        "Done. Inserted %d new states from %d snapshots.", len(inserted), seen.count
     )
-    with eng.begin() as con:
-        con.execute(sql, df.to_dict(orient="records"))
-    logger.info("Done.")
 
 
 if __name__ == "__main__":
@@ -1,15 +1,18 @@
-import os
 import json
 import logging
 from datetime import datetime, timezone
 from typing import List, Dict, Any
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 
 from aeropulse.utils.logging_config import setup_logger
 from aeropulse.etl.load.loader.mongo_loader import latest_docs_by_keys
-from aeropulse.etl.load.loader.pg_loader import upsert_jsonb_rows, masked_dsn_for_log
+from aeropulse.etl.load.loader.pg_loader import (
+    get_engine,
+    masked_dsn_for_log,
+    upsert_jsonb_rows,
+)
 
 logger = setup_logger(__name__)
 logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
@@ -18,12 +21,8 @@ logging.getLogger("urllib3.connectionpool").setLevel(logging.WARNING)
 def main():
     load_dotenv()
 
-    dsn = os.getenv("POSTGRES_DSN") or os.getenv("DATABASE_URL")
-    if not dsn:
-        raise RuntimeError("Set POSTGRES_DSN or DATABASE_URL")
-
     logger.info("Connecting to DB (write curated): %s", masked_dsn_for_log())
-    engine = create_engine(dsn, future=True)
+    engine = get_engine()
 
     with engine.connect() as conn:
         rows = conn.execute(text("SELECT h3_res6 FROM public.weather_res6")).fetchall()
@@ -1,12 +1,22 @@
 import os
-from datetime import datetime, timedelta, timezone
+from typing import List
 import pandas as pd
-from sqlalchemy import text
-from aeropulse.etl.load.loader.pg_loader import get_engine, masked_dsn_for_log
+from aeropulse.etl.load.loader.pg_loader import (
+    bulk_upsert,
+    get_engine,
+    masked_dsn_for_log,
+)
 from aeropulse.etl.load.loader.mongo_loader import get_collection, insert_batch
+from aeropulse.etl.transform.queries.weather_prefetch import prefetch_along_paths
+from aeropulse.etl.transform.queries.weather_refresh_queue import (
+    claim_cells,
+    schedule_refresh,
+)
 from aeropulse.services.openweather_client import OpenWeatherClient
+from aeropulse.services.weather_cache import CachedWeather, WeatherCache
 from aeropulse.utils.logging_config import setup_logger
 from aeropulse.utils.parquet_io import write_parquet_partitioned
+from aeropulse.utils.rate_limit import openweather_limiter
 
 logger = setup_logger(__name__)
 
@@ -16,49 +26,30 @@ BATCH_CAP = int(os.getenv("WEATHER_ACTIVE_CELLS_CAP", "250"))
 
 def main():
     eng = get_engine()
-    ow = OpenWeatherClient()
-
-    # 1) recent cells from states (last 20 min)
-    with eng.begin() as con:
-        rows = con.execute(
-            text(
-                """
-            SELECT DISTINCT h3_res6
-            FROM public.opensky_states
-            WHERE ts >= now() - interval '20 minutes'
-              AND h3_res6 IS NOT NULL
-            LIMIT :cap
-        """
-            ),
-            {"cap": BATCH_CAP},
-        ).fetchall()
-    cells = [r[0] for r in rows]
-    if not cells:
-        logger.info("No active cells.")
-        return
+    budget = openweather_limiter(eng)
+    # read through the shared cache (TTL = freshness window), so a cell any
+    # weather job fetched recently costs no API call; the limiter is shared too
+    cache = WeatherCache(
+        OpenWeatherClient(),
+        eng,
+        FRESH_MIN * 60,
+        limiter=budget,
+        units=os.getenv("OWM_UNITS", "standard"),
+    )
 
-    # 2) staleness check against weather_res6
-    with eng.begin() as con:
-        stale = con.execute(
-            text(
-                f"""
-            SELECT c.h3_res6
-            FROM (SELECT UNNEST(:cells) AS h3_res6) c
-            LEFT JOIN public.weather_res6 w ON w.h3_res6 = c.h3_res6
-            WHERE w.last_updated IS NULL OR w.last_updated < now() - interval '{FRESH_MIN} minutes'
-        """
-            ),
-            {"cells": cells},
-        ).fetchall()
-    stale_cells = [r[0] for r in stale]
+    # 1-2) highest-value stale cells from the shared refresh queue, scored by
+    # recent traffic, staleness and volatility, plus cells on predicted paths
+    schedule_refresh(eng, FRESH_MIN)
+    if os.getenv("WEATHER_PREFETCH", "true").lower() in ("1", "true", "yes"):
+        prefetch_along_paths(eng, FRESH_MIN)
+    stale_cells = claim_cells(min(BATCH_CAP, budget.remaining()), eng)
     if not stale_cells:
-        logger.info("All active cells are fresh.")
+        logger.info("No stale cells queued for refresh.")
         return
 
     logger.info(
-        "Refreshing %d/%d active cells. DB=%s",
+        "Refreshing %d queued cells. DB=%s",
         len(stale_cells),
-        len(cells),
         masked_dsn_for_log(),
     )
 
@@ -67,32 +58,38 @@ def main():
     hist_rows = []
     latest_rows = []
     parquet_rows = []
-    now = datetime.now(timezone.utc)
 
+    cached = cache.lookup(stale_cells)
+    entries: List[CachedWeather] = list(cached.values())
     for cell in stale_cells:
-        lat, lon = ow.h3_cell_center(cell)
-        data = ow.get_current(lat, lon)  # dict
-        mongo_doc = {
-            "h3_res6": cell,
-            "fetched_at": now,
-            "lat": lat,
-            "lon": lon,
-            "payload": data,
-        }
+        if cell in cached:
+            continue
+        entry = cache.get(cell)
+        if entry is None:
+            logger.info("OpenWeather daily budget exhausted; stopping early.")
+            break
+        entries.append(entry)
+
+    for e in entries:
+        now = e.fetched_at
+        latest_rows.append(
+            {"h3_res6": e.h3_res6, "last_updated": now, "weather": e.payload}
+        )
+        # a cache hit is an observation some job already recorded; only new
+        # API results go to history (volatility is scored on it), Mongo and Parquet
+        if e.source != "api":
+            continue
         parquet_rows.append(
             {
-                "h3_res6": cell,
+                "h3_res6": e.h3_res6,
                 "fetched_at": now,
-                "lat": lat,
-                "lon": lon,
-                "payload": data,
+                "lat": e.lat,
+                "lon": e.lon,
+                "payload": e.payload,
             }
         )
+        hist_rows.append({"h3_res6": e.h3_res6, "ts": now, "weather": e.payload})
 
-        hist_rows.append({"h3_res6": cell, "fetched_at": now, "weather": data})
-        latest_rows.append({"h3_res6": cell, "last_updated": now, "weather": data})
-
-        # batch Mongo insert in-memory; we’ll insert once after loop
     insert_batch(weather_coll, (dict(d) for d in parquet_rows))
 
     # parquet
@@ -103,47 +100,31 @@ def main():
             dt=df["fetched_at"].dt.strftime("%Y-%m-%d"),
             hour=df["fetched_at"].dt.strftime("%H"),
         )
-        write_parquet_partitioned(df2, out_dir, ["dt", "hour"])
+        # every run writes freshly fetched rows only, so append
+        write_parquet_partitioned(df2, out_dir, ["dt", "hour"], append=True)
 
-    # Postgres history + latest
+    # Postgres latest + history (latest first: history rows reference the cell)
     with eng.begin() as con:
-        con.execute(
-            text(
-                """
-            INSERT INTO public.weather_res6_history (h3_res6, fetched_at, weather)
-            VALUES (:h3_res6, :fetched_at, CAST(:weather AS JSONB))
-        """
-            ),
-            [
-                {
-                    "h3_res6": r["h3_res6"],
-                    "fetched_at": r["fetched_at"],
-                    "weather": r["weather"],
-                }
-                for r in hist_rows
-            ],
+        bulk_upsert(
+            "public.weather_res6",
+            ["h3_res6", "last_updated", "weather"],
+            latest_rows,
+            conflict_cols=["h3_res6"],
+            update_cols=["last_updated", "weather"],
+            conn=con,
         )
-
-        con.execute(
-            text(
-                """
-            INSERT INTO public.weather_res6 (h3_res6, last_updated, weather)
-            VALUES (:h3_res6, :last_updated, CAST(:weather AS JSONB))
-            ON CONFLICT (h3_res6)
-            DO UPDATE SET last_updated = EXCLUDED.last_updated, weather = EXCLUDED.weather
-        """
-            ),
-            [
-                {
-                    "h3_res6": r["h3_res6"],
-                    "last_updated": r["last_updated"],
-                    "weather": r["weather"],
-                }
-                for r in latest_rows
-            ],
+        bulk_upsert(
+            "public.weather_res6_history",
+            ["h3_res6", "ts", "weather"],
+            hist_rows,
+            conn=con,
         )
 
-    logger.info("Weather refresh complete for %d cells.", len(stale_cells))
+    logger.info(
+        "Weather refresh complete for %d cells (%d from cache).",
+        len(entries),
+        len(entries) - len(hist_rows),
+    )
 
 
 if __name__ == "__main__":
@@ -5,8 +5,12 @@ import sys
 import subprocess
 from datetime import datetime
 
+from dotenv import load_dotenv
+
 from aeropulse.etl.bootstrap_db import bootstrap_db
 
+load_dotenv()
+
 
 def run(cmd, env=None):
     """Run a python -m step and echo the command."""
@@ -15,8 +19,10 @@ def run(cmd, env=None):
 
 
 def city_list_present():
-    path_json = os.path.join("data", "raw_data", "city_list_json.json")
-    path_gz = os.path.join("data", "raw_data", "city_list_json.gz")
+    # same location the extractor writes to (DOWNLOAD_DIR)
+    download_dir = os.getenv("DOWNLOAD_DIR", os.path.join("data", "raw_data"))
+    path_json = os.path.join(download_dir, "city_list_json.json")
+    path_gz = os.path.join(download_dir, "city_list_json.gz")
     return os.path.exists(path_json) or os.path.exists(path_gz)
 
 
@@ -25,15 +31,14 @@ def main():
     print("= bootstrapping database schema (no Alembic)...", flush=True)
     bootstrap_db()
 
-    # 1) Optionally extract city list (skip if file already exists unless forced)
+    # 1) Refresh city list. The download is conditional (ETag/Last-Modified),
+    #    so an unchanged upstream file costs one 304; FORCE_EXTRACT=true re-downloads.
     force_extract = os.getenv("FORCE_EXTRACT", "false").lower() in ("1", "true", "yes")
-    if force_extract or not city_list_present():
-        print("= extracting city list from OpenWeather...", flush=True)
-        run([sys.executable, "-m", "aeropulse.etl.extract.extract_city_list"])
-    else:
-        print(
-            f"= city list present ({city_list_present()}), skip extract (FORCE_EXTRACT={force_extract})"
-        )
+    print(
+        f"= refreshing city list (present={city_list_present()}, FORCE_EXTRACT={force_extract})...",
+        flush=True,
+    )
+    run([sys.executable, "-m", "aeropulse.etl.extract.extract_city_list"])
 
     # 2) Raw cities -> MongoDB
     run(
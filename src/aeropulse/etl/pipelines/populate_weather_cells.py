@@ -4,24 +4,22 @@ import os
 from typing import List, Set
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine.url import make_url
+from sqlalchemy import text
 
+from aeropulse.etl.load.loader.pg_loader import get_engine, masked_dsn_for_log
 from aeropulse.utils.logging_config import setup_logger
 from aeropulse.etl.transform.queries.gen_h3_cells import compute_h3_res6
+from aeropulse.etl.transform.queries.weather_coverage import sync_cell_map
 
 logger = setup_logger(__name__)
 
 
 def main():
     load_dotenv()
+    full = os.getenv("CITY_SYNC_FULL", "false").lower() in ("1", "true", "yes")
 
-    dsn = os.getenv("POSTGRES_DSN") or os.getenv("DATABASE_URL")
-    if not dsn:
-        raise RuntimeError("Set POSTGRES_DSN or DATABASE_URL")
-
-    logger.info("Connecting to DB: %s", make_url(dsn).set(password="***"))
-    engine = create_engine(dsn, future=True)
+    logger.info("Connecting to DB: %s", masked_dsn_for_log())
+    engine = get_engine()
 
     # 1) compute h3_res6 for cities (updates cities_us.h3_res6) and collect unique cells
     from sqlalchemy.orm import sessionmaker
@@ -29,7 +27,7 @@ def main():
     Session = sessionmaker(bind=engine, future=True)
     with Session() as session:
         cells_set: Set[str] = compute_h3_res6(
-            session
+            session, only_missing=not full
         )  # updates cities_us and returns unique cells
     cells: List[str] = sorted(cells_set)
     logger.info("Collected %d unique res6 cells from cities.", len(cells))
@@ -58,6 +56,9 @@ def main():
 
     logger.info("Seeded %d res6 weather cells", total)
 
+    # 3) map new cells onto their shared weather source (WEATHER_COVERAGE_RES)
+    sync_cell_map(engine)
+
 
 if __name__ == "__main__":
     main()
@@ -1,73 +1,113 @@
-import math
-import h3
-from typing import List, Set
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from typing import Iterator, List, Optional, Sequence, Set, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import select
+from aeropulse.etl.load.loader.pg_loader import bulk_update
 from aeropulse.models.city import City
+from aeropulse.utils.h3_utils import latlng_to_cells
 from aeropulse.utils.logging_config import setup_logger  # or your get_logger alias
 
 logger = setup_logger("gen_h3_cells.log")
 
+H3_BATCH_SIZE = int(os.getenv("H3_BATCH_SIZE", "50000"))
+# 0/1 = compute in-process; >1 fans batches out over a process pool
+H3_WORKERS = int(os.getenv("H3_WORKERS", "0"))
 
-# Compatibility wrapper for H3 v3/v4
-def _h3_index(lat: float, lon: float, res: int) -> str:
-    # prefer v3 name if present
-    if hasattr(h3, "geo_to_h3"):
-        return h3.geo_to_h3(lat, lon, res)
-    # v4 name
-    if hasattr(h3, "latlng_to_cell"):
-        return h3.latlng_to_cell(lat, lon, res)
-    raise RuntimeError("No suitable H3 function found (geo_to_h3 or latlng_to_cell).")
+CityCoords = Tuple[int, float, float, Optional[str]]
 
 
-def _coerce_finite(x):
-    try:
-        v = float(x)
-        if not math.isfinite(v):
-            return None
-        return v
-    except Exception:
-        return None
+def _cells_for_batch(
+    batch: Sequence[CityCoords],
+) -> Tuple[List[Tuple[int, str]], List[str], int]:
+    """
+    Compute res6 cells for one batch of (city_id, lat, lon, current_cell).
+
+    Module-level so it can run in a worker process. Returns
+    (changed (city_id, cell) pairs, all cells seen, skipped count); rows whose
+    cell already matches are not returned as changes.
+    """
+    if not batch:
+        return [], [], 0
+    ids, lats, lons, current = zip(*batch)
+    # None/NaN/out-of-range coordinates come back as None
+    cells = latlng_to_cells(
+        np.asarray(lats, dtype=float), np.asarray(lons, dtype=float), 6
+    )
+    changed: List[Tuple[int, str]] = []
+    seen: List[str] = []
+    for city_id, cell, cur in zip(ids, cells, current):
+        if cell is None:
+            continue
+        seen.append(cell)
+        if cell != cur:
+            changed.append((city_id, cell))
+    return changed, seen, len(batch) - len(seen)
+
+
+def _stream_coords(
+    session: Session, only_missing: bool, batch_size: int
+) -> Iterator[List[CityCoords]]:
+    """Yield (city_id, lat, lon, h3_res6) batches through a server-side cursor."""
+    stmt = select(City.city_id, City.lat, City.lon, City.h3_res6)
+    if only_missing:
+        stmt = stmt.where(City.h3_res6.is_(None))
+    result = session.execute(
+        stmt, execution_options={"stream_results": True, "yield_per": batch_size}
+    )
+    for part in result.partitions(batch_size):
+        yield [tuple(r) for r in part]
 
 
-def compute_h3_res6(session: Session) -> List[str]:
-    # If your table is big, consider chunking with .offset/.limit like before.
-    rows = session.execute(select(City)).scalars().all()
+def compute_h3_res6(session: Session, only_missing: bool = False) -> List[str]:
+    """
+    Set cities_us.h3_res6 and return the unique res6 cells touched.
+    only_missing=True restricts the work to cities without a cell yet
+    (new or moved since the last sync), so only that delta is seeded.
+
+    Coordinates are streamed in H3_BATCH_SIZE batches (optionally spread over
+    H3_WORKERS processes) and only cells that actually changed are written
+    back, with a single COPY-staged UPDATE ... FROM. Nothing here is US
+    specific: the scope is whatever the city loader put in cities_us.
+    """
+    batches = _stream_coords(session, only_missing, H3_BATCH_SIZE)
 
     unique: Set[str] = set()
+    changed: List[Tuple[int, str]] = []
     skipped = 0
-    for city in rows:
-        lat = _coerce_finite(city.lat)
-        lon = _coerce_finite(city.lon)
-        if (
-            lat is None
-            or lon is None
-            or not (-90 <= lat <= 90)
-            or not (-180 <= lon <= 180)
-        ):
-            skipped += 1
-            continue
-        try:
-            cell = _h3_index(lat, lon, 6)
-        except Exception as e:
-            # log and skip this row
-            logger.warning(
-                "Failed H3 for city_id=%s (%s,%s): %s",
-                getattr(city, "city_id", None),
-                lat,
-                lon,
-                e,
-            )
-            skipped += 1
-            continue
-        city.h3_res6 = cell
-        unique.add(cell)
+    seen = 0
+
+    def collect(res: Tuple[List[Tuple[int, str]], List[str], int]) -> None:
+        nonlocal skipped, seen
+        batch_changed, batch_cells, batch_skipped = res
+        changed.extend(batch_changed)
+        unique.update(batch_cells)
+        skipped += batch_skipped
+        seen += len(batch_cells) + batch_skipped
+
+    if H3_WORKERS > 1:
+        with ProcessPoolExecutor(max_workers=H3_WORKERS) as pool:
+            for res in pool.map(_cells_for_batch, batches):
+                collect(res)
+    else:
+        for batch in batches:
+            collect(_cells_for_batch(batch))
 
+    if changed:
+        bulk_update(
+            "public.cities_us",
+            ["city_id"],
+            ["h3_res6"],
+            changed,
+            conn=session.connection(),
+        )
     session.commit()
     logger.info(
-        "Updated %d cities (skipped %d). Unique res6 cells: %d",
-        len(rows) - skipped,
+        "Computed H3 for %d cities (skipped %d, changed %d). Unique res6 cells: %d",
+        seen - skipped,
         skipped,
+        len(changed),
         len(unique),
     )
     return list(unique)
@@ -1,7 +1,6 @@
-import os
 from typing import Dict, Iterable, Iterator, List, Optional
 from dotenv import load_dotenv
-from aeropulse.etl.load.loader import mongo_client
+from aeropulse.etl.load.loader import get_collection
 
 load_dotenv()
 
@@ -45,8 +44,7 @@ def us_cities_from_mongo(
             - lat (float | None): Latitude.
             - lon (float | None): Longitude.
     """
-    db = mongo_client()[os.getenv("MONGO_DB")]
-    coll = db["cities"]
+    coll = get_collection("cities")
 
     query: Dict = {"country": "US"}
 
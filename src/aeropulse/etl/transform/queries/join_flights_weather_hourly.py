@@ -1,8 +1,12 @@
 import os
-from datetime import datetime, timezone, timedelta
 import pandas as pd
 from sqlalchemy import text
-from aeropulse.etl.load.loader.pg_loader import get_engine, masked_dsn_for_log
+from sqlalchemy.engine import Engine
+from aeropulse.etl.load.loader.pg_loader import (
+    bulk_insert_new,
+    get_engine,
+    masked_dsn_for_log,
+)
 from aeropulse.utils.logging_config import setup_logger
 from aeropulse.utils.parquet_io import write_parquet_partitioned
 
@@ -10,128 +14,214 @@ logger = setup_logger(__name__)
 
 # how far we’re willing to look for the closest weather snapshot
 MATCH_TOL_MIN = int(os.getenv("WEATHER_MATCH_TOL_MIN", "15"))
+# "pandas": pull states + weather and merge_asof here, also writing Parquet;
+# "sql": one INSERT ... SELECT inside Postgres, nothing crosses the wire
+JOIN_MODE = os.getenv("WEATHER_JOIN_MODE", "pandas").lower()
+
+
+HIT_COLUMNS = [
+    "icao24",
+    "callsign",
+    "t",
+    "h3_res6",
+    "weather_h3_res6",
+    "weather_ts",
+    "weather",
+]
+# unique key of flight_weather_hits; reruns insert nothing twice
+HIT_KEY = ["icao24", "t", "h3_res6"]
+
+# typed weather columns (generated from the payload, see bootstrap_db) carried
+# into the Parquet output instead of the JSON
+WX_COLUMNS = [
+    "wx_main",
+    "wx_temp",
+    "wx_wind_speed",
+    "wx_wind_gust",
+    "wx_visibility",
+    "wx_clouds",
+    "wx_pressure",
+]
+
+
+def join_nearest_weather(df_s: pd.DataFrame, df_w: pd.DataFrame) -> pd.DataFrame:
+    """
+    Match every state with the weather snapshot of its source cell nearest
+    in time (within ±MATCH_TOL_MIN) in one merge_asof over both frames,
+    grouped by a shared categorical cell key. Unmatched states are dropped.
+    """
+    cats = pd.Index(df_s["weather_h3_res6"]).union(pd.Index(df_w["weather_h3_res6"]))
+    cell_type = pd.CategoricalDtype(cats.unique())
+    df_s = df_s.assign(
+        ts=pd.to_datetime(df_s["ts"], utc=True),
+        weather_h3_res6=df_s["weather_h3_res6"].astype(cell_type),
+    ).sort_values("ts")
+    df_w = df_w.assign(
+        fetched_at=pd.to_datetime(df_w["fetched_at"], utc=True),
+        weather_h3_res6=df_w["weather_h3_res6"].astype(cell_type),
+    ).sort_values("fetched_at")
+
+    out = pd.merge_asof(
+        df_s,
+        df_w,
+        left_on="ts",
+        right_on="fetched_at",
+        by="weather_h3_res6",
+        direction="nearest",
+        tolerance=pd.Timedelta(minutes=MATCH_TOL_MIN),
+    )
+    out = out.dropna(subset=["fetched_at"])  # keep only matched rows
+    out["weather_h3_res6"] = out["weather_h3_res6"].astype(str)
+    return out.reset_index(drop=True)
+
+
+def join_in_database(eng: Engine) -> int:
+    """
+    Set-based variant of the join: for each last-hour state, a LATERAL probe
+    walks the (h3_res6, ts DESC) history index once backwards and once
+    forwards from the state time, keeps the nearer snapshot within the
+    tolerance, and the result is inserted directly into flight_weather_hits.
+    Hits already stored are skipped. Returns the number of hits written.
+    """
+    cols = ", ".join(HIT_COLUMNS)
+    with eng.begin() as con:
+        res = con.execute(
+            text(
+                f"""
+            INSERT INTO public.flight_weather_hits ({cols})
+            SELECT s.icao24, s.callsign, s.ts, s.h3_res6, src.h3_res6,
+                   w.ts, w.weather
+            FROM public.opensky_states s
+            LEFT JOIN public.weather_cell_map m ON m.h3_res6 = s.h3_res6
+            CROSS JOIN LATERAL (
+                SELECT COALESCE(m.source_h3_res6, s.h3_res6) AS h3_res6
+            ) src
+            CROSS JOIN LATERAL (
+                SELECT c.ts, c.weather
+                FROM (
+                    (SELECT h.ts, h.weather
+                     FROM public.weather_res6_history h
+                     WHERE h.h3_res6 = src.h3_res6
+                       AND h.ts <= s.ts
+                       AND h.ts >= s.ts - make_interval(mins => :tol)
+                     ORDER BY h.ts DESC
+                     LIMIT 1)
+                    UNION ALL
+                    (SELECT h.ts, h.weather
+                     FROM public.weather_res6_history h
+                     WHERE h.h3_res6 = src.h3_res6
+                       AND h.ts > s.ts
+                       AND h.ts <= s.ts + make_interval(mins => :tol)
+                     ORDER BY h.ts ASC
+                     LIMIT 1)
+                ) c
+                ORDER BY abs(EXTRACT(EPOCH FROM c.ts - s.ts))
+                LIMIT 1
+            ) w
+            WHERE s.ts >= now() - interval '1 hour'
+              AND s.h3_res6 IS NOT NULL
+            ON CONFLICT ({", ".join(HIT_KEY)}) DO NOTHING
+        """
+            ),
+            {"tol": MATCH_TOL_MIN},
+        )
+        return res.rowcount
 
 
 def main():
     eng = get_engine()
-    now = datetime.now(timezone.utc)
-    t0 = now - timedelta(hours=1)
+    if JOIN_MODE == "sql":
+        written = join_in_database(eng)
+        logger.info(
+            "Joined %d hits in Postgres (±%d min). DB=%s",
+            written,
+            MATCH_TOL_MIN,
+            masked_dsn_for_log(),
+        )
+        return
 
-    # Pull last-hour states
+    # Pull last-hour states, each with the cell its weather comes from
+    # (itself, or a shared neighbour; see weather_coverage)
     with eng.begin() as con:
-        states = (
-            con.execute(
-                text(
-                    """
-            SELECT ts, icao24, callsign, h3_res6
-            FROM public.opensky_states
-            WHERE ts >= now() - interval '1 hour'
-              AND h3_res6 IS NOT NULL
+        res = con.execute(
+            text(
+                """
+            SELECT s.ts, s.icao24, s.callsign, s.h3_res6,
+                   COALESCE(m.source_h3_res6, s.h3_res6) AS weather_h3_res6
+            FROM public.opensky_states s
+            LEFT JOIN public.weather_cell_map m ON m.h3_res6 = s.h3_res6
+            WHERE s.ts >= now() - interval '1 hour'
+              AND s.h3_res6 IS NOT NULL
         """
-                )
             )
-            .mappings()
-            .all()
         )
-
-        # Pull relevant weather history for those cells within tolerance window
-        cells = list({r["h3_res6"] for r in states})
-        if not cells:
+        df_s = pd.DataFrame(res.fetchall(), columns=list(res.keys()))
+        if df_s.empty:
             logger.info("No states in last hour.")
             return
 
-        weather = (
-            con.execute(
-                text(
-                    """
-            SELECT h3_res6, fetched_at, weather
+        # Relevant weather history for those source cells, with its typed columns
+        res = con.execute(
+            text(
+                f"""
+            SELECT h3_res6 AS weather_h3_res6,
+                   ts AS fetched_at,
+                   weather,
+                   {", ".join(WX_COLUMNS)}
             FROM public.weather_res6_history
             WHERE h3_res6 = ANY(:cells)
-              AND fetched_at >= now() - interval '2 hours'
+              AND ts >= now() - interval '2 hours'
         """
-                ),
-                {"cells": cells},
-            )
-            .mappings()
-            .all()
+            ),
+            {"cells": df_s["weather_h3_res6"].unique().tolist()},
         )
+        df_w = pd.DataFrame(res.fetchall(), columns=list(res.keys()))
 
-    if not states or not weather:
+    if df_w.empty:
         logger.info("Not enough data to join.")
         return
 
-    df_s = pd.DataFrame(states)
-    df_w = pd.DataFrame(weather)
-
-    # For each state row, pick nearest-in-time weather on same cell
-    df_s["key"] = df_s["h3_res6"]
-    df_w["key"] = df_w["h3_res6"]
-
-    # Sort and asof-merge by time per cell
-    df_s = df_s.sort_values(["key", "ts"]).reset_index(drop=True)
-    df_w = df_w.sort_values(["key", "fetched_at"]).reset_index(drop=True)
-
-    # group-based nearest merge
-    out_rows = []
-    tol = pd.Timedelta(minutes=MATCH_TOL_MIN)
-    for cell, g_s in df_s.groupby("key"):
-        g_w = df_w[df_w["key"] == cell]
-        if g_w.empty:
-            continue
-        merged = pd.merge_asof(
-            g_s.sort_values("ts"),
-            g_w[["fetched_at", "weather"]].sort_values("fetched_at"),
-            left_on="ts",
-            right_on="fetched_at",
-            direction="nearest",
-            tolerance=tol,
-        )
-        merged["h3_res6"] = cell
-        out_rows.append(merged)
-
-    if not out_rows:
+    out = join_nearest_weather(df_s, df_w)
+    if out.empty:
         logger.info("No matches within ±%d minutes.", MATCH_TOL_MIN)
         return
 
-    out = pd.concat(out_rows, ignore_index=True)
-    out = out.dropna(subset=["fetched_at"])  # keep only matched rows
-    out["weather_summary"] = out["weather"].apply(
-        lambda w: w.get("weather", [{}])[0].get("main") if isinstance(w, dict) else None
+    # Write to Postgres (COPY staged), straight from the columns; hits
+    # already stored by an earlier run are left alone
+    inserted = bulk_insert_new(
+        "public.flight_weather_hits",
+        HIT_COLUMNS,
+        out[
+            [
+                "icao24",
+                "callsign",
+                "ts",
+                "h3_res6",
+                "weather_h3_res6",
+                "fetched_at",
+                "weather",
+            ]
+        ].itertuples(index=False, name=None),
+        conflict_cols=HIT_KEY,
     )
 
-    # Write to Postgres
-    with eng.begin() as con:
-        con.execute(
-            text(
-                """
-            INSERT INTO public.flight_weather_hits
-                (ts_state, icao24, callsign, h3_res6, weather_at, weather, weather_summary)
-            VALUES
-                (:ts_state, :icao24, :callsign, :h3_res6, :weather_at, CAST(:weather AS JSONB), :weather_summary)
-        """
-            ),
-            [
-                {
-                    "ts_state": r["ts"],
-                    "icao24": r["icao24"],
-                    "callsign": r["callsign"],
-                    "h3_res6": r["h3_res6"],
-                    "weather_at": r["fetched_at"],
-                    "weather": r["weather"],
-                    "weather_summary": r["weather_summary"],
-                }
-                for _, r in out.iterrows()
-            ],
+    # Parquet output for viz: typed weather columns, not the payload. The
+    # last hour is re-joined every run, so only hits new to Postgres are
+    # appended.
+    new_keys = pd.DataFrame(inserted, columns=["icao24", "ts", "h3_res6"])
+    new_keys["ts"] = pd.to_datetime(new_keys["ts"], utc=True)
+    new = out.merge(new_keys, on=["icao24", "ts", "h3_res6"])
+    if not new.empty:
+        out_dir = os.getenv("PROCESSED_DIR", "data/processed/flight_weather_hits")
+        out2 = new.drop(columns=["weather"]).assign(
+            dt=new["ts"].dt.strftime("%Y-%m-%d"), hour=new["ts"].dt.strftime("%H")
         )
-
-    # Parquet output for viz
-    out_dir = os.getenv("PROCESSED_DIR", "data/processed/flight_weather_hits")
-    out2 = out.assign(
-        dt=out["ts"].dt.strftime("%Y-%m-%d"), hour=out["ts"].dt.strftime("%H")
-    )
-    write_parquet_partitioned(out2, out_dir, ["dt", "hour"])
+        write_parquet_partitioned(out2, out_dir, ["dt", "hour"], append=True)
     logger.info(
-        "Joined %d hits → Postgres + Parquet. DB=%s", len(out), masked_dsn_for_log()
+        "Joined %d hits (%d new) → Postgres + Parquet. DB=%s",
+        len(out),
+        len(new),
+        masked_dsn_for_log(),
     )
 
 
@@ -1,75 +1,124 @@
 # src/aeropulse/etl/transform/queries/opensky_to_hits.py
 import datetime as dt
-from typing import Dict, Iterable, Iterator, List
+from typing import Dict, Iterable, List
 
-import h3
+import numpy as np
+import pandas as pd
 from pymongo.collection import Collection
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
+from aeropulse.etl.transform.queries.weather_coverage import resolve_sources
+from aeropulse.utils.h3_utils import latlng_to_cells
 
-def _latest_region_docs(coll: Collection, limit_per_region: int = 1) -> List[Dict]:
-    """Return the latest snapshot doc per region from Mongo."""
-    out: List[Dict] = []
-    for doc in coll.aggregate(
-        [
-            {"$sort": {"region_code": 1, "t": -1}},
-            {"$group": {"_id": "$region_code", "doc": {"$first": "$$ROOT"}}},
-        ]
-    ):
-        out.append(doc["doc"])
-    return out
 
+def _latest_region_docs(
+    states_coll: Collection, latest_coll: Collection, max_age_minutes: int
+) -> Iterable[Dict]:
+    """
+    Latest snapshot docs per region, via the pointers fetch_us_states keeps
+    in `latest_coll`: one small doc per region plus an _id lookup, however
+    much history `states_coll` holds. Regions not refreshed within
+    `max_age_minutes` (e.g. bboxes dropped by adaptive tiling) are skipped.
+    """
+    cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=max_age_minutes)
+    doc_ids: List = []
+    for p in latest_coll.find({"fetched_at": {"$gte": cutoff}}, {"doc_ids": 1}):
+        doc_ids.extend(p.get("doc_ids") or [])
+    if not doc_ids:
+        return []
+    return states_coll.find({"_id": {"$in": doc_ids}}, {"time": 1, "states": 1})
 
-def _iter_states_from_docs(docs: Iterable[Dict]) -> Iterator[Dict]:
-    """Yield individual state dicts from snapshot docs, carrying snapshot time."""
+
+# position of each field in an OpenSky REST state vector (list form)
+_VECTOR_INDEX = {"icao24": 0, "callsign": 1, "lon": 5, "lat": 6}
+
+
+def _state_columns(docs: Iterable[Dict]) -> pd.DataFrame:
+    """
+    One columnar frame (t, icao24, callsign, lat, lon) for all states in the
+    snapshot docs, carrying each snapshot's time, one row per aircraft. States may be raw REST
+    vectors or dicts keyed like the OpenSky Python API; rows without a
+    position are skipped.
+    """
+    t: List = []
+    icao24: List = []
+    callsign: List = []
+    lat: List = []
+    lon: List = []
+    ix = _VECTOR_INDEX
     for d in docs:
-        t_snap = d.get("t")
-        for s in d.get("states", []) or []:
-            if s.get("latitude") is None or s.get("longitude") is None:
+        t_snap = d.get("t", d.get("time"))
+        for s in d.get("states") or []:
+            if isinstance(s, dict):
+                la, lo = s.get("latitude"), s.get("longitude")
+                ic, cs = s.get("icao24"), s.get("callsign")
+            else:
+                la, lo = s[ix["lat"]], s[ix["lon"]]
+                ic, cs = s[ix["icao24"]], s[ix["callsign"]]
+            if la is None or lo is None:
                 continue
-            yield {
-                "t": t_snap,
-                "icao24": s.get("icao24"),
-                "callsign": (s.get("callsign") or "").strip() or None,
-                "lat": float(s["latitude"]),
-                "lon": float(s["longitude"]),
-                "velocity": s.get("velocity"),
-                "vertical_rate": s.get("vertical_rate"),
-                "on_ground": s.get("on_ground"),
-            }
+            t.append(t_snap)
+            icao24.append(ic)
+            callsign.append(cs)
+            lat.append(la)
+            lon.append(lo)
+
+    df = pd.DataFrame(
+        {
+            "t": t,
+            "icao24": icao24,
+            "callsign": callsign,
+            "lat": np.asarray(lat, dtype=float),
+            "lon": np.asarray(lon, dtype=float),
+        }
+    )
+    if df.empty:
+        return df
+    df["callsign"] = df["callsign"].str.strip().replace("", np.nan)
+    # OpenSky snapshot times are epoch seconds; hits store TIMESTAMPTZ
+    numeric = pd.api.types.is_numeric_dtype(df["t"])
+    df["t"] = pd.to_datetime(df["t"], unit="s" if numeric else None, utc=True)
+    # an aircraft seen in more than one region snapshot: keep its newest fix
+    return df.sort_values("t").drop_duplicates("icao24", keep="last")
 
 
 def build_hits_from_latest_snapshots(
     *,
     mongo_opensky_coll: Collection,
+    mongo_latest_coll: Collection,
     pg_engine: Engine,
     weather_staleness_minutes: int = 60,
+    snapshot_max_age_minutes: int = 60,
 ) -> List[Dict]:
     """
     For latest OpenSky snapshots per region:
-      - compute H3 res6 for each state
-      - fetch the most recent curated weather for that cell (within staleness window)
+      - compute H3 res6 for all states in one vectorised call
+      - resolve each cell's weather source (itself, or a shared neighbour; see weather_coverage)
+      - join the most recent curated weather for that source (within staleness window)
       - return rows suitable for inserting into flight_weather_hits
     """
-    docs = _latest_region_docs(mongo_opensky_coll)
-    states = list(_iter_states_from_docs(docs))
-    if not states:
+    docs = _latest_region_docs(
+        mongo_opensky_coll, mongo_latest_coll, snapshot_max_age_minutes
+    )
+    states = _state_columns(docs)
+    if states.empty:
         return []
 
-    rows: List[Dict] = []
     cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(
         minutes=weather_staleness_minutes
     )
 
-    needed_cells = sorted({h3.geo_to_h3(s["lat"], s["lon"], 6) for s in states})
+    states["h3_res6"] = latlng_to_cells(states["lat"], states["lon"], 6)
+    states = states.dropna(subset=["h3_res6"])
+    needed_cells = sorted(states["h3_res6"].unique())
     if not needed_cells:
         return []
 
-    # fetch curated weather for those cells from Postgres
+    # fetch curated weather for the source cells from Postgres
     sql = text(
         """
-        SELECT h3_res6, last_updated, weather
+        SELECT h3_res6 AS weather_h3_res6, last_updated AS weather_ts, weather
         FROM public.weather_res6
         WHERE h3_res6 = ANY(:cells)
           AND last_updated IS NOT NULL
@@ -77,30 +126,25 @@ def build_hits_from_latest_snapshots(
         """
     )
     with pg_engine.begin() as conn:
-        wrows = (
-            conn.execute(sql, {"cells": needed_cells, "cutoff": cutoff})
-            .mappings()
-            .all()
+        sources = resolve_sources(conn, needed_cells)
+        res = conn.execute(
+            sql, {"cells": sorted(set(sources.values())), "cutoff": cutoff}
         )
+        weather = pd.DataFrame(res.fetchall(), columns=list(res.keys()))
+    if weather.empty:
+        return []
 
-    weather_map = {
-        r["h3_res6"]: {"last_updated": r["last_updated"], "weather": r["weather"]}
-        for r in wrows
-    }
-
-    for s in states:
-        cell = h3.geo_to_h3(s["lat"], s["lon"], 6)
-        w = weather_map.get(cell)
-        if not w:
-            continue
-        rows.append(
-            {
-                "icao24": s["icao24"],
-                "callsign": s["callsign"],
-                "t": s["t"],
-                "h3_res6": cell,
-                "weather_ts": w["last_updated"],
-                "weather": w["weather"],
-            }
-        )
-    return rows
+    states["weather_h3_res6"] = states["h3_res6"].map(sources)
+    hits = states.merge(weather, on="weather_h3_res6", how="inner")
+    hits = hits.astype(object).where(hits.notna(), None)
+    return hits[
+        [
+            "icao24",
+            "callsign",
+            "t",
+            "h3_res6",
+            "weather_h3_res6",
+            "weather_ts",
+            "weather",
+        ]
+    ].to_dict("records")
@@ -0,0 +1,102 @@
+import os
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from aeropulse.etl.load.loader.pg_loader import bulk_upsert, get_engine
+from aeropulse.utils.h3_utils import representative_cell
+from aeropulse.utils.logging_config import setup_logger
+
+logger = setup_logger(__name__)
+
+# Weather is fetched once per COVERAGE_RES parent (its center res-6 child) and
+# shared by the parent's res-6 children: 5 -> 7 children, 4 -> 49.
+# 6 keeps one observation per res-6 cell.
+COVERAGE_RES = int(os.getenv("WEATHER_COVERAGE_RES", "6"))
+
+
+def source_cells(cells: Iterable[str], res: int = COVERAGE_RES) -> Dict[str, str]:
+    """res-6 cell -> res-6 cell whose weather it uses."""
+    return {c: representative_cell(c, res) for c in cells}
+
+
+def sync_cell_map(engine: Optional[Engine] = None, res: int = COVERAGE_RES) -> int:
+    """
+    Map every known res-6 cell (weather_res6 plus last-hour traffic) to its
+    weather source in public.weather_cell_map, recording the coverage
+    resolution as provenance. Only unmapped cells, or cells mapped at another
+    resolution, are computed. Source cells are seeded into weather_res6 so
+    the refresh jobs pick them up. Returns the number of cells (re)mapped.
+    """
+    engine = engine or get_engine()
+    with engine.begin() as con:
+        rows = con.execute(
+            text(
+                """
+                SELECT c.h3_res6
+                FROM (
+                    SELECT h3_res6 FROM public.weather_res6
+                    UNION
+                    SELECT DISTINCT h3_res6
+                    FROM public.opensky_states
+                    WHERE ts >= now() - interval '1 hour' AND h3_res6 IS NOT NULL
+                ) c
+                LEFT JOIN public.weather_cell_map m ON m.h3_res6 = c.h3_res6
+                WHERE m.h3_res6 IS NULL OR m.coverage_res <> :res
+            """
+            ),
+            {"res": res},
+        ).fetchall()
+        if not rows:
+            return 0
+
+        mapping = source_cells((r[0] for r in rows), res)
+        bulk_upsert(
+            "public.weather_res6",
+            ["h3_res6"],
+            ((s,) for s in set(mapping.values())),
+            conflict_cols=["h3_res6"],
+            conn=con,
+        )
+        bulk_upsert(
+            "public.weather_cell_map",
+            ["h3_res6", "source_h3_res6", "coverage_res"],
+            ((c, s, res) for c, s in mapping.items()),
+            conflict_cols=["h3_res6"],
+            update_cols=["source_h3_res6", "coverage_res"],
+            conn=con,
+        )
+    logger.info(
+        "Mapped %d res6 cells onto %d weather source cells (coverage res %d).",
+        len(mapping),
+        len(set(mapping.values())),
+        res,
+    )
+    return len(mapping)
+
+
+def resolve_sources(con: Connection, cells: Iterable[str]) -> Dict[str, str]:
+    """
+    Weather source for each cell via weather_cell_map; cells not mapped yet
+    fall back to the current COVERAGE_RES rule.
+    """
+    cells = list(cells)
+    rows = con.execute(
+        text(
+            """
+            SELECT h3_res6, source_h3_res6
+            FROM public.weather_cell_map
+            WHERE h3_res6 = ANY(:cells)
+        """
+        ),
+        {"cells": cells},
+    ).fetchall()
+    mapped = {c: s for c, s in rows}
+    missing = [c for c in cells if c not in mapped]
+    mapped.update(source_cells(missing))
+    return mapped
+
+
+if __name__ == "__main__":
+    sync_cell_map()
@@ -0,0 +1,185 @@
+import math
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from aeropulse.etl.load.loader.pg_loader import bulk_upsert, get_engine
+from aeropulse.etl.transform.queries.weather_coverage import source_cells
+from aeropulse.etl.transform.queries.weather_refresh_queue import (
+    MAX_STALENESS,
+    TRAFFIC_WEIGHT,
+    enqueue_cells,
+)
+from aeropulse.utils.h3_utils import latlng_to_cells
+from aeropulse.utils.logging_config import setup_logger
+
+logger = setup_logger(__name__)
+
+PREFETCH_HORIZON_MIN = int(os.getenv("WEATHER_PREFETCH_HORIZON_MIN", "20"))
+PREFETCH_STEP_MIN = int(os.getenv("WEATHER_PREFETCH_STEP_MIN", "2"))
+# only aircraft reported within this window are extrapolated
+PREFETCH_LOOKBACK_MIN = int(os.getenv("WEATHER_PREFETCH_LOOKBACK_MIN", "10"))
+
+EARTH_RADIUS_M = 6_371_000.0
+
+_STATE_COLUMNS = [
+    "icao24",
+    "ts",
+    "lat",
+    "lon",
+    "velocity",
+    "heading",
+    "vert_rate",
+    "alt",
+]
+
+
+def _latest_airborne(engine: Engine, lookback_min: int) -> pd.DataFrame:
+    with engine.connect() as con:
+        rows = con.execute(
+            text(
+                """
+                SELECT DISTINCT ON (icao24)
+                       icao24, ts, lat, lon, velocity, heading, vert_rate,
+                       COALESCE(geo_altitude, baro_altitude) AS alt
+                FROM public.opensky_states
+                WHERE ts >= now() - make_interval(mins => :lookback)
+                  AND NOT COALESCE(on_ground, false)
+                  AND lat IS NOT NULL AND lon IS NOT NULL
+                  AND velocity IS NOT NULL AND heading IS NOT NULL
+                ORDER BY icao24, ts DESC
+            """
+            ),
+            {"lookback": lookback_min},
+        ).fetchall()
+    return pd.DataFrame(rows, columns=_STATE_COLUMNS)
+
+
+def predicted_cells(
+    states: pd.DataFrame,
+    now: datetime,
+    horizon_min: int = PREFETCH_HORIZON_MIN,
+    step_min: int = PREFETCH_STEP_MIN,
+) -> Dict[str, Tuple[int, float]]:
+    """
+    Dead-reckon each state along its great circle (velocity, heading) every
+    `step_min` minutes up to `horizon_min` ahead of `now`, stopping once
+    vert_rate would bring it to the ground. Returns
+    res-6 cell -> (aircraft expected, earliest arrival in seconds from now).
+    """
+    if states.empty:
+        return {}
+
+    lat0 = np.radians(states["lat"].to_numpy(dtype=float))
+    lon0 = np.radians(states["lon"].to_numpy(dtype=float))
+    v = states["velocity"].to_numpy(dtype=float)
+    brg = np.radians(states["heading"].to_numpy(dtype=float))
+    vr = np.nan_to_num(states["vert_rate"].to_numpy(dtype=float))
+    alt = states["alt"].to_numpy(dtype=float)
+    # seconds already elapsed since each report
+    age = (now - pd.to_datetime(states["ts"], utc=True)).dt.total_seconds().to_numpy()
+
+    offsets = np.arange(step_min, horizon_min + step_min, step_min) * 60.0
+    t = age[:, None] + offsets[None, :]  # seconds since report, (aircraft, step)
+    eta = np.broadcast_to(offsets, t.shape)
+
+    d = (v[:, None] * t) / EARTH_RADIUS_M  # angular distance
+    lat0_, lon0_, brg_ = lat0[:, None], lon0[:, None], brg[:, None]
+    lat = np.arcsin(
+        np.sin(lat0_) * np.cos(d) + np.cos(lat0_) * np.sin(d) * np.cos(brg_)
+    )
+    lon = lon0_ + np.arctan2(
+        np.sin(brg_) * np.sin(d) * np.cos(lat0_),
+        np.cos(d) - np.sin(lat0_) * np.sin(lat),
+    )
+    lon = (lon + np.pi) % (2 * np.pi) - np.pi
+
+    # descending aircraft drop out once they would reach the ground
+    airborne = ~(np.isfinite(alt)[:, None] & (alt[:, None] + vr[:, None] * t <= 0))
+
+    ids = np.broadcast_to(np.arange(len(states))[:, None], t.shape)
+    cells = latlng_to_cells(np.degrees(lat[airborne]), np.degrees(lon[airborne]), 6)
+    path = pd.DataFrame(
+        {"cell": cells, "aircraft": ids[airborne], "eta": eta[airborne]}
+    ).dropna(subset=["cell"])
+    if path.empty:
+        return {}
+
+    agg = path.groupby("cell").agg(n=("aircraft", "nunique"), eta=("eta", "min"))
+    return {c: (int(r.n), float(r.eta)) for c, r in agg.iterrows()}
+
+
+def prefetch_along_paths(
+    engine: Optional[Engine] = None,
+    fresh_min: int = 30,
+    horizon_min: int = PREFETCH_HORIZON_MIN,
+) -> int:
+    """
+    Queue weather source cells that airborne flights will enter within the
+    horizon and whose weather will be stale on arrival. Priority is on the
+    scheduler's scale (traffic term x max staleness), discounted for later
+    arrivals, so imminent cells compete with today's stalest ones; the daily
+    budget is unchanged, only its order. Queued cells missing from
+    weather_res6 are seeded there. Returns the number of cells queued.
+    """
+    engine = engine or get_engine()
+    now = datetime.now(timezone.utc)
+    states = _latest_airborne(engine, PREFETCH_LOOKBACK_MIN)
+    ahead = predicted_cells(states, now, horizon_min=horizon_min)
+    if not ahead:
+        return 0
+
+    # fold children onto their shared weather source
+    by_source: Dict[str, Tuple[int, float]] = {}
+    for cell, src in source_cells(ahead).items():
+        n, eta = ahead[cell]
+        prev_n, prev_eta = by_source.get(src, (0, math.inf))
+        by_source[src] = (prev_n + n, min(prev_eta, eta))
+
+    with engine.connect() as con:
+        rows = con.execute(
+            text(
+                """
+                SELECT h3_res6, EXTRACT(EPOCH FROM now() - last_updated)
+                FROM public.weather_res6
+                WHERE h3_res6 = ANY(:cells) AND last_updated IS NOT NULL
+            """
+            ),
+            {"cells": list(by_source)},
+        ).fetchall()
+    age_sec = {c: float(a) for c, a in rows}
+
+    priorities: Dict[str, float] = {}
+    for src, (n, eta) in by_source.items():
+        # still fresh when the first aircraft gets there: nothing to do
+        if src in age_sec and age_sec[src] + eta < fresh_min * 60:
+            continue
+        urgency = 1.0 - 0.5 * min(1.0, eta / (horizon_min * 60.0))
+        priorities[src] = (1 + TRAFFIC_WEIGHT * math.log1p(n)) * MAX_STALENESS * urgency
+
+    # a cell nobody has visited yet has no weather_res6 row, and the loaders
+    # only sync cells that do; seed them so the fetched payload lands there
+    with engine.begin() as con:
+        bulk_upsert(
+            "public.weather_res6",
+            ["h3_res6"],
+            ((src,) for src in priorities),
+            conflict_cols=["h3_res6"],
+            conn=con,
+        )
+    queued = enqueue_cells(priorities, "prefetch", engine)
+    logger.info(
+        "Prefetch: %d cells on predicted paths, %d queued ahead of arrival.",
+        len(by_source),
+        queued,
+    )
+    return queued
+
+
+if __name__ == "__main__":
+    prefetch_along_paths(fresh_min=int(os.getenv("WEATHER_FRESH_MINUTES", "30")))
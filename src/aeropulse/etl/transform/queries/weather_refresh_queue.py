@@ -0,0 +1,198 @@
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from aeropulse.etl.load.loader.pg_loader import bulk_upsert, get_engine
+from aeropulse.etl.transform.queries.weather_coverage import sync_cell_map
+from aeropulse.utils.logging_config import setup_logger
+
+logger = setup_logger(__name__)
+
+# scoring knobs
+TRAFFIC_WINDOW_MIN = int(os.getenv("WEATHER_TRAFFIC_WINDOW_MIN", "20"))
+VOLATILITY_WINDOW_HOURS = int(os.getenv("WEATHER_VOLATILITY_WINDOW_HOURS", "6"))
+TRAFFIC_WEIGHT = float(os.getenv("WEATHER_PRIORITY_TRAFFIC_WEIGHT", "1.0"))
+VOLATILITY_WEIGHT = float(os.getenv("WEATHER_PRIORITY_VOLATILITY_WEIGHT", "0.5"))
+# staleness counts in freshness windows, capped so never-fetched cells do not dominate
+MAX_STALENESS = float(os.getenv("WEATHER_PRIORITY_MAX_STALENESS", "3"))
+
+
+def schedule_refresh(engine: Optional[Engine] = None, fresh_min: int = 30) -> int:
+    """
+    Score every stale cell and (re)write public.weather_refresh_queue.
+
+    priority = (1 + w_t * ln(1 + states in the cell over the traffic window))
+             * min(max_staleness, age / fresh window)   (never fetched = max)
+             * (1 + w_v * volatility)
+
+    where volatility is the recent stddev of temperature plus the number of
+    condition changes in weather_res6_history. Only weather source cells are
+    queued (see weather_coverage): a child's traffic counts towards its source.
+    Cells that are fresh again, or no longer a source, are dropped from the
+    queue. Entries added by other producers (e.g. prefetch) keep the higher
+    of their priority and the scheduled one.
+    Returns the number of queued cells.
+    """
+    engine = engine or get_engine()
+    params = {
+        "fresh_min": fresh_min,
+        "traffic_min": TRAFFIC_WINDOW_MIN,
+        "vol_hours": VOLATILITY_WINDOW_HOURS,
+        "wt": TRAFFIC_WEIGHT,
+        "wv": VOLATILITY_WEIGHT,
+        "max_stale": MAX_STALENESS,
+    }
+    sync_cell_map(engine)
+    with engine.begin() as con:
+        con.execute(
+            text(
+                """
+                DELETE FROM public.weather_refresh_queue q
+                USING public.weather_res6 w
+                WHERE w.h3_res6 = q.h3_res6
+                  AND w.last_updated >= now() - make_interval(mins => :fresh_min)
+            """
+            ),
+            params,
+        )
+        con.execute(
+            text(
+                """
+                DELETE FROM public.weather_refresh_queue q
+                USING public.weather_cell_map m
+                WHERE m.h3_res6 = q.h3_res6 AND m.source_h3_res6 <> q.h3_res6
+            """
+            )
+        )
+        con.execute(
+            text(
+                """
+                WITH traffic AS (
+                    SELECT COALESCE(m.source_h3_res6, s.h3_res6) AS h3_res6, COUNT(*) AS n
+                    FROM public.opensky_states s
+                    LEFT JOIN public.weather_cell_map m ON m.h3_res6 = s.h3_res6
+                    WHERE s.ts >= now() - make_interval(mins => :traffic_min)
+                      AND s.h3_res6 IS NOT NULL
+                    GROUP BY 1
+                ),
+                vol AS (
+                    SELECT h3_res6,
+                           COALESCE(stddev_samp(wx_temp), 0)
+                           + GREATEST(COUNT(DISTINCT wx_main) - 1, 0)
+                               AS v
+                    FROM public.weather_res6_history
+                    WHERE ts >= now() - make_interval(hours => :vol_hours)
+                    GROUP BY h3_res6
+                ),
+                cand AS (
+                    SELECT COALESCE(w.h3_res6, t.h3_res6) AS h3_res6,
+                           w.last_updated,
+                           COALESCE(t.n, 0) AS n
+                    FROM (
+                        SELECT w.h3_res6, w.last_updated
+                        FROM public.weather_res6 w
+                        LEFT JOIN public.weather_cell_map m ON m.h3_res6 = w.h3_res6
+                        WHERE m.source_h3_res6 IS NULL OR m.source_h3_res6 = w.h3_res6
+                    ) w
+                    FULL OUTER JOIN traffic t ON t.h3_res6 = w.h3_res6
+                    WHERE w.last_updated IS NULL
+                       OR w.last_updated < now() - make_interval(mins => :fresh_min)
+                )
+                INSERT INTO public.weather_refresh_queue (h3_res6, priority, reason, enqueued_at)
+                SELECT c.h3_res6,
+                       (1 + :wt * ln(1 + c.n))
+                       * LEAST(
+                           :max_stale,
+                           COALESCE(
+                               EXTRACT(EPOCH FROM now() - c.last_updated) / 60.0 / :fresh_min,
+                               :max_stale
+                           )
+                         )
+                       * (1 + :wv * COALESCE(v.v, 0)),
+                       'schedule',
+                       now()
+                FROM cand c
+                LEFT JOIN vol v ON v.h3_res6 = c.h3_res6
+                ON CONFLICT (h3_res6) DO UPDATE
+                SET priority = CASE
+                        WHEN weather_refresh_queue.reason = 'schedule' THEN EXCLUDED.priority
+                        ELSE GREATEST(weather_refresh_queue.priority, EXCLUDED.priority)
+                    END,
+                    enqueued_at = EXCLUDED.enqueued_at
+            """
+            ),
+            params,
+        )
+        queued = con.execute(
+            text("SELECT COUNT(*) FROM public.weather_refresh_queue")
+        ).scalar_one()
+    logger.info("Weather refresh queue holds %d stale cells.", queued)
+    return int(queued)
+
+
+def enqueue_cells(
+    priorities: Dict[str, float],
+    reason: str,
+    engine: Optional[Engine] = None,
+) -> int:
+    """
+    Add cells to the queue, keeping the higher priority for cells already
+    queued. The winning priority carries its reason, so a boosted scheduled
+    entry is no longer rewritten by the next schedule_refresh.
+    """
+    if not priorities:
+        return 0
+    engine = engine or get_engine()
+    now = datetime.now(timezone.utc)
+    with engine.begin() as con:
+        return bulk_upsert(
+            "public.weather_refresh_queue",
+            ["h3_res6", "priority", "reason", "enqueued_at"],
+            ((cell, p, reason, now) for cell, p in priorities.items()),
+            conflict_cols=["h3_res6"],
+            update_cols={
+                "priority": "GREATEST(public.weather_refresh_queue.priority, EXCLUDED.priority)",
+                "reason": (
+                    "CASE WHEN EXCLUDED.priority > public.weather_refresh_queue.priority"
+                    " THEN EXCLUDED.reason ELSE public.weather_refresh_queue.reason END"
+                ),
+            },
+            conn=con,
+        )
+
+
+def claim_cells(limit: int, engine: Optional[Engine] = None) -> List[str]:
+    """
+    Take up to `limit` highest-priority cells off the queue, highest first.
+    SKIP LOCKED lets several weather workers claim concurrently without
+    handing out the same cell twice; cells a worker fails to refresh are
+    re-queued by the next schedule_refresh while they stay stale.
+    """
+    if limit <= 0:
+        return []
+    engine = engine or get_engine()
+    with engine.begin() as con:
+        rows = con.execute(
+            text(
+                """
+                DELETE FROM public.weather_refresh_queue
+                WHERE h3_res6 IN (
+                    SELECT h3_res6
+                    FROM public.weather_refresh_queue
+                    ORDER BY priority DESC
+                    LIMIT :lim
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING h3_res6, priority
+            """
+            ),
+            {"lim": limit},
+        ).fetchall()
+    return [cell for cell, _ in sorted(rows, key=lambda r: r[1], reverse=True)]
+
+
+if __name__ == "__main__":
+    schedule_refresh(fresh_min=int(os.getenv("WEATHER_FRESH_MINUTES", "30")))
@@ -14,3 +14,4 @@ class City(Base):
     lat = Column(Float, nullable=False)
     lon = Column(Float, nullable=False)
     h3_res6 = Column(String(16), index=True)
+    content_hash = Column(String(40))
@@ -1,9 +1,26 @@
-from sqlalchemy import Column, String, DateTime, JSON
+from sqlalchemy import Column, Computed, String, DateTime, Double, JSON, Text
 from aeropulse.models.base import Base
 
+# Hot OpenWeather fields as typed columns, generated by Postgres from the
+# payload on write (units follow OWM_UNITS at fetch time). Single source for
+# the ORM and for the DDL in etl/bootstrap_db.py: name -> (type, expression).
+WEATHER_COLUMNS = {
+    "wx_main": (Text, "weather->'weather'->0->>'main'"),
+    "wx_temp": (Double, "(weather->'main'->>'temp')::double precision"),
+    "wx_wind_speed": (Double, "(weather->'wind'->>'speed')::double precision"),
+    "wx_wind_gust": (Double, "(weather->'wind'->>'gust')::double precision"),
+    "wx_visibility": (Double, "(weather->>'visibility')::double precision"),
+    "wx_clouds": (Double, "(weather->'clouds'->>'all')::double precision"),
+    "wx_pressure": (Double, "(weather->'main'->>'pressure')::double precision"),
+}
+
 
 class WeatherRes6(Base):
     __tablename__ = "weather_res6"
     h3_res6 = Column(String(16), primary_key=True)
     last_updated = Column(DateTime)
     weather = Column(JSON)
+
+
+for _name, (_type, _expr) in WEATHER_COLUMNS.items():
+    setattr(WeatherRes6, _name, Column(_type, Computed(_expr, persisted=True)))
@@ -1,4 +1,5 @@
 from .openweather_client import OpenWeatherClient
+from .weather_cache import CachedWeather, WeatherCache
 
 
-__all__ = ["OpenWeatherClient"]
+__all__ = ["OpenWeatherClient", "CachedWeather", "WeatherCache"]
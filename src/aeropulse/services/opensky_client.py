@@ -1,11 +1,20 @@
 # src/aeropulse/services/opensky_client.py
 
+import json
 import os
+import threading
 import time
-from typing import Dict, Optional, List, Tuple
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, List, Tuple
 import requests
 from dotenv import load_dotenv
 
+try:  # POSIX only; without it the token file is shared unlocked
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from aeropulse.utils.json_stream import JsonStream
 from aeropulse.utils.logging_config import setup_logger
 
 load_dotenv()
@@ -14,60 +23,190 @@ logger = setup_logger("OpenSkyClient.log")
 OPENSKY_AUTH_URL = "https://auth.opensky-network.org/auth/realms/opensky-network/protocol/openid-connect/token"
 OPENSKY_API_BASE = "https://opensky-network.org/api"
 
-# simple in-memory token cache
-_token_cache: Dict[str, float | str | None] = {
-    "access_token": None,
-    "expires_at": 0.0,
-}
+# Optional file shared by short-lived processes until the token expires
+# (empty = in-memory only); renewal starts this many seconds before expiry,
+# but never earlier than halfway through the token's lifetime.
+OPENSKY_TOKEN_CACHE_FILE = os.getenv("OPENSKY_TOKEN_CACHE_FILE", "")
+OPENSKY_TOKEN_REFRESH_AHEAD_SEC = float(
+    os.getenv("OPENSKY_TOKEN_REFRESH_AHEAD_SEC", "300")
+)
+_REFRESH_AHEAD_MAX_FRACTION = 0.5
 
 
-def _get_access_token() -> str:
-    now = time.time()
-    if _token_cache["access_token"] and now < float(_token_cache["expires_at"]):
-        return str(_token_cache["access_token"])
-
+def _credentials() -> Tuple[str, str]:
     client_id = os.getenv("OPENSKY_CLIENT_ID")
     client_secret = os.getenv("OPENSKY_CLIENT_SECRET")
     if not client_id or not client_secret:
         raise RuntimeError(
             "Set OPENSKY_CLIENT_ID and OPENSKY_CLIENT_SECRET in your environment"
         )
+    return client_id, client_secret
+
 
+def _request_token(client_id: str, client_secret: str) -> Tuple[str, float]:
     data = {
         "grant_type": "client_credentials",
         "client_id": client_id,
         "client_secret": client_secret,
     }
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    now = time.time()
     resp = requests.post(OPENSKY_AUTH_URL, data=data, headers=headers, timeout=30)
     resp.raise_for_status()
     payload = resp.json()
-    token = payload["access_token"]
     expires_in = float(payload.get("expires_in", 1800.0))
     # keep 60s safety buffer
-    _token_cache["access_token"] = token
-    _token_cache["expires_at"] = now + max(60.0, expires_in - 60.0)
-    return token
+    return payload["access_token"], now + max(60.0, expires_in - 60.0)
+
+
+class _TokenProvider:
+    """
+    Client-credentials token shared by all threads of the process.
+
+    Refreshes are single-flight (one POST however many callers find the
+    token expired), a token close to expiry is renewed on a background
+    thread while callers keep using it, and with `cache_file` set the token
+    is shared through a 0600 JSON file so each short-lived job does not
+    start with its own auth round trip.
+    """
+
+    def __init__(self, cache_file: str = "", refresh_ahead: float = 300.0):
+        self._cache_file = os.path.expanduser(cache_file) if cache_file else ""
+        self._refresh_ahead = refresh_ahead
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lifetime = 0.0
+        self._renewing = False
+
+    def _ahead(self) -> float:
+        """Refresh-ahead window, clamped so a short-lived token is not renewed on every call."""
+        return min(self._refresh_ahead, _REFRESH_AHEAD_MAX_FRACTION * self._lifetime)
+
+    def _set(self, token: str, expires_at: float) -> None:
+        self._token, self._expires_at = token, expires_at
+        self._lifetime = max(0.0, expires_at - time.time())
+
+    def token(self) -> str:
+        token, expires_at = self._token, self._expires_at
+        now = time.time()
+        if token and now < expires_at:
+            if expires_at - now < self._ahead():
+                self._renew_in_background()
+            return token
+        with self._lock:
+            # another thread may have refreshed while we waited
+            if self._token and time.time() < self._expires_at:
+                return self._token
+            self._refresh(min_ttl=0.0)
+            return str(self._token)
+
+    def _renew_in_background(self) -> None:
+        with self._lock:
+            if self._renewing:
+                return
+            self._renewing = True
+        threading.Thread(
+            target=self._renew, name="opensky-token-renew", daemon=True
+        ).start()
+
+    def _renew(self) -> None:
+        try:
+            with self._lock:
+                ahead = self._ahead()
+                if self._expires_at - time.time() >= ahead:
+                    return
+                self._refresh(min_ttl=ahead)
+        except Exception as e:
+            # the current token is still valid; the next caller retries
+            logger.warning("Background OpenSky token renewal failed: %s", e)
+        finally:
+            self._renewing = False
+
+    def _refresh(self, min_ttl: float) -> None:
+        """Adopt a cached token with > min_ttl left, else fetch one. Holds _lock."""
+        client_id, client_secret = _credentials()
+        if self._adopt_cached(client_id, min_ttl):
+            return
+        with self._file_lock():
+            # another process may have refreshed while we waited for the lock
+            if self._adopt_cached(client_id, min_ttl):
+                return
+            self._set(*_request_token(client_id, client_secret))
+            self._write_cache(client_id)
+        logger.info("Fetched a new OpenSky access token.")
+
+    def _adopt_cached(self, client_id: str, min_ttl: float) -> bool:
+        if not self._cache_file:
+            return False
+        try:
+            with open(self._cache_file, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            token = cached["access_token"]
+            expires_at = float(cached["expires_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if cached.get("client_id") != client_id:
+            return False
+        if expires_at - time.time() <= min_ttl:
+            return False
+        self._set(token, expires_at)
+        return True
+
+    def _write_cache(self, client_id: str) -> None:
+        if not self._cache_file:
+            return
+        payload = {
+            "client_id": client_id,
+            "access_token": self._token,
+            "expires_at": self._expires_at,
+        }
+        tmp = f"{self._cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self._cache_file) or ".", exist_ok=True)
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp, self._cache_file)
+        except OSError as e:
+            logger.warning("Could not write OpenSky token cache %s: %s", tmp, e)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Cross-process lock around the token POST (no-op without a cache file)."""
+        if not self._cache_file or fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self._cache_file) or ".", exist_ok=True)
+        with open(f"{self._cache_file}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_tokens = _TokenProvider(OPENSKY_TOKEN_CACHE_FILE, OPENSKY_TOKEN_REFRESH_AHEAD_SEC)
+
+
+def _get_access_token() -> str:
+    return _tokens.token()
 
 
 def _auth_headers() -> Dict[str, str]:
     return {"Authorization": f"Bearer {_get_access_token()}"}
 
 
-def get_states_all(
+def _states_params(
     *,
-    lamin: Optional[float] = None,
-    lomin: Optional[float] = None,
-    lamax: Optional[float] = None,
-    lomax: Optional[float] = None,
-    time_sec: Optional[int] = None,
-    icao24: Optional[List[str]] = None,
-    extended: bool = False,
-) -> Dict:
-    """
-    Wrapper for GET /states/all (authenticated).
-    Returns raw JSON.
-    """
+    lamin: Optional[float],
+    lomin: Optional[float],
+    lamax: Optional[float],
+    lomax: Optional[float],
+    time_sec: Optional[int],
+    icao24: Optional[List[str]],
+    extended: bool,
+) -> List[Tuple[str, object]]:
     params: List[Tuple[str, object]] = []
     if time_sec is not None:
         params.append(("time", int(time_sec)))
@@ -85,8 +224,97 @@ def get_states_all(
     if icao24:
         for a in icao24:
             params.append(("icao24", a))
+    return params
+
 
+def get_states_all(
+    *,
+    lamin: Optional[float] = None,
+    lomin: Optional[float] = None,
+    lamax: Optional[float] = None,
+    lomax: Optional[float] = None,
+    time_sec: Optional[int] = None,
+    icao24: Optional[List[str]] = None,
+    extended: bool = False,
+) -> Dict:
+    """
+    Wrapper for GET /states/all (authenticated).
+    Returns raw JSON.
+    """
+    params = _states_params(
+        lamin=lamin,
+        lomin=lomin,
+        lamax=lamax,
+        lomax=lomax,
+        time_sec=time_sec,
+        icao24=icao24,
+        extended=extended,
+    )
     url = f"{OPENSKY_API_BASE}/states/all"
     r = requests.get(url, headers=_auth_headers(), params=params, timeout=60)
     r.raise_for_status()
     return r.json()
+
+
+def stream_states_all(
+    *,
+    lamin: Optional[float] = None,
+    lomin: Optional[float] = None,
+    lamax: Optional[float] = None,
+    lomax: Optional[float] = None,
+    time_sec: Optional[int] = None,
+    icao24: Optional[List[str]] = None,
+    extended: bool = False,
+    batch_size: int = 1000,
+) -> Iterator[Tuple[Dict, List[list]]]:
+    """
+    Streaming variant of get_states_all.
+
+    Requests a gzip body and parses the `states` array incrementally,
+    yielding (meta, states_batch) with at most `batch_size` state vectors
+    per batch. `meta` holds the top-level fields read so far. OpenSky sends
+    `time` before `states`; should a response list them the other way
+    round, its batches are held back until the object ends so every batch
+    still carries the snapshot time. A response without states yields one
+    (meta, []) pair so the snapshot time is still reported.
+    """
+    params = _states_params(
+        lamin=lamin,
+        lomin=lomin,
+        lamax=lamax,
+        lomax=lomax,
+        time_sec=time_sec,
+        icao24=icao24,
+        extended=extended,
+    )
+    url = f"{OPENSKY_API_BASE}/states/all"
+    headers = {**_auth_headers(), "Accept-Encoding": "gzip"}
+    with requests.get(
+        url, headers=headers, params=params, timeout=60, stream=True
+    ) as r:
+        r.raise_for_status()
+        r.encoding = "utf-8"
+        stream = JsonStream(r.iter_content(chunk_size=1 << 16, decode_unicode=True))
+
+        meta: Dict = {}
+        batch: List[list] = []
+        held: List[List[list]] = []  # batches read before `time`
+        emitted = False
+        for key in stream.iter_object():
+            if key == "states" and stream.peek() == "[":
+                for s in stream.iter_array():
+                    batch.append(s)
+                    if len(batch) >= batch_size:
+                        if "time" in meta:
+                            yield dict(meta), batch
+                            emitted = True
+                        else:
+                            held.append(batch)
+                        batch = []
+            else:
+                meta[key] = stream.value()
+        for b in held:
+            yield dict(meta), b
+            emitted = True
+        if batch or not emitted:
+            yield dict(meta), batch
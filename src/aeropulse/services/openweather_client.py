@@ -1,4 +1,5 @@
 import os
+import threading
 import time
 from typing import Optional, Dict, Any
 
@@ -16,10 +17,112 @@ def _redact(url: str) -> str:
     return re.sub(r"(appid=)[^&]+", r"\\1<redacted>", url or "")
 
 
+class CircuitOpenError(RuntimeError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+def _retry_after(resp: requests.Response, default: float) -> float:
+    try:
+        return max(0.0, float(resp.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return default
+
+
+class _AimdLimiter:
+    """
+    Additive-increase / multiplicative-decrease cap on in-flight requests,
+    shared by all threads using one client. Successes grow the limit by
+    about one per limit's worth of responses; a 429/5xx halves it (at most
+    once per `cooldown`, so one burst of errors is one decrease). `pause`
+    holds every caller until a Retry-After deadline, not just the one that
+    got the 429.
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, cooldown: float = 1.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(self.max_limit)
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    self.in_flight += 1
+                    return
+
+    def release(self, ok: bool) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if ok:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            else:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit / 2.0)
+                    self._last_decrease = now
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class _CircuitBreaker:
+    """
+    Opens after `threshold` consecutive upstream failures and rejects calls
+    for `cooldown` seconds; then lets one probe through (half-open), which
+    closes it on success or re-opens it on failure.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                raise CircuitOpenError(
+                    f"OpenWeather circuit open after {self._failures} consecutive failures"
+                )
+            self._probing = True
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
 class OpenWeatherClient:
     """
     Minimal client for OpenWeather 'Current Weather Data' endpoint.
     Uses a single API key (no One Call 3.0).
+
+    adaptive=True is meant for callers with many threads: in-flight requests
+    are capped by an AIMD limit (up to `pool_maxsize`), a 429 Retry-After
+    pauses every caller of this client, and a circuit breaker makes calls
+    fail fast with CircuitOpenError while upstream keeps failing.
     """
 
     def __init__(
@@ -29,6 +132,11 @@ class OpenWeatherClient:
         timeout: float = 15.0,
         max_retries: int = 3,
         backoff_factor: float = 0.5,
+        pool_maxsize: int = 10,
+        adaptive: bool = False,
+        min_concurrency: int = 1,
+        breaker_failures: int = 5,
+        breaker_cooldown_sec: float = 60.0,
     ):
         self.api_key = api_key or os.getenv("OPENWEATHER_API_KEY")
         if not self.api_key:
@@ -36,16 +144,28 @@ class OpenWeatherClient:
 
         self.current_base = current_base
         self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.adaptive = adaptive
 
         self.session = requests.Session()
-        retries = Retry(
-            total=max_retries,
-            backoff_factor=backoff_factor,
-            status_forcelist=(429, 500, 502, 503, 504),
-            raise_on_status=False,
-        )
-        self.session.mount("https://", HTTPAdapter(max_retries=retries))
-        self.session.mount("http://", HTTPAdapter(max_retries=retries))
+        if adaptive:
+            # status retries are handled in current(), so a 429 never sleeps
+            # inside urllib3 while holding a connection and a concurrency slot
+            self._limiter = _AimdLimiter(min_concurrency, pool_maxsize)
+            self._breaker = _CircuitBreaker(breaker_failures, breaker_cooldown_sec)
+            retries = Retry(total=max_retries, status=0, backoff_factor=backoff_factor)
+        else:
+            retries = Retry(
+                total=max_retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(429, 500, 502, 503, 504),
+                raise_on_status=False,
+            )
+        # one shared session; size the pool so concurrent callers reuse connections
+        adapter = HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def current(
         self,
@@ -68,6 +188,9 @@ class OpenWeatherClient:
         if lang:
             params["lang"] = lang
 
+        if self.adaptive:
+            return self._check(self._get_adaptive(params))
+
         resp = self.session.get(self.current_base, params=params, timeout=self.timeout)
 
         # Retry-After handling for 429
@@ -81,6 +204,43 @@ class OpenWeatherClient:
             except Exception:
                 pass
 
+        return self._check(resp)
+
+    def _get_adaptive(self, params: Dict[str, Any]) -> requests.Response:
+        """GET under the AIMD limit, breaker and global Retry-After pause."""
+        for attempt in range(self.max_retries + 1):
+            self._breaker.allow()
+            self._limiter.acquire()
+            ok = False
+            try:
+                resp = self.session.get(
+                    self.current_base, params=params, timeout=self.timeout
+                )
+                ok = resp.status_code != 429 and resp.status_code < 500
+            except requests.RequestException:
+                self._breaker.record(False)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff_factor * (2**attempt))
+                continue
+            finally:
+                self._limiter.release(ok)
+
+            # throttling is not an outage: upstream answered, so the breaker sees success
+            self._breaker.record(resp.status_code < 500)
+            if resp.status_code == 429:
+                self._limiter.pause(
+                    _retry_after(resp, self.backoff_factor * (2**attempt))
+                )
+                continue
+            if resp.status_code >= 500 and attempt < self.max_retries:
+                time.sleep(self.backoff_factor * (2**attempt))
+                continue
+            return resp
+        return resp
+
+    @staticmethod
+    def _check(resp: requests.Response) -> Dict[str, Any]:
         # Unauthorized → raise with safe URL (no key)
         if resp.status_code == 401:
             detail = (
@@ -0,0 +1,267 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from aeropulse.services.openweather_client import OpenWeatherClient
+from aeropulse.utils.h3_utils import cell_to_latlng
+from aeropulse.utils.logging_config import setup_logger
+
+logger = setup_logger("weather_cache.log")
+
+
+class CachedWeather(NamedTuple):
+    h3_res6: str
+    lat: float
+    lon: float
+    fetched_at: datetime
+    payload: Dict[str, Any]
+    source: str  # "memory" | "db" | "api"
+
+
+class WeatherCache:
+    """
+    Read-through cache of OpenWeather current conditions keyed by h3_res6.
+
+    Tiers: an in-process LRU, then public.weather_cache in Postgres (shared
+    by every job and host), then the API. An entry is fresh for `ttl_sec`.
+    Concurrent misses for one cell are single-flight: threads of this
+    process share one in-flight lookup, and across processes a leased row
+    in public.weather_cache_claims makes the second caller wait for the
+    first one's row instead of calling the API again. No transaction is
+    open while the limiter waits or the API is called.
+
+    `limiter` (DailyBudget / PgTokenBucket) is only charged for real API
+    calls and refunded when one fails; `get` returns None when it refuses.
+    """
+
+    def __init__(
+        self,
+        client: OpenWeatherClient,
+        engine: Engine,
+        ttl_sec: float,
+        *,
+        limiter=None,
+        units: str = "standard",
+        max_entries: int = 4096,
+        claim_sec: float = 60.0,
+        poll_sec: float = 0.5,
+    ):
+        self.client = client
+        self.engine = engine
+        self.ttl = timedelta(seconds=ttl_sec)
+        self.limiter = limiter
+        self.units = units
+        self.max_entries = max_entries
+        self.claim_sec = claim_sec
+        self.poll_sec = poll_sec
+        self._lru: "OrderedDict[str, CachedWeather]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    # ---- in-process tier ----
+
+    def _memory_get(self, cell: str) -> Optional[CachedWeather]:
+        with self._lock:
+            entry = self._lru.get(cell)
+            if entry is None:
+                return None
+            if datetime.now(timezone.utc) - entry.fetched_at >= self.ttl:
+                del self._lru[cell]
+                return None
+            self._lru.move_to_end(cell)
+            return entry._replace(source="memory")
+
+    def _memory_put(self, entry: CachedWeather) -> None:
+        with self._lock:
+            self._lru[entry.h3_res6] = entry
+            self._lru.move_to_end(entry.h3_res6)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    # ---- Postgres tier ----
+
+    def _row_entry(self, row) -> CachedWeather:
+        cell, lat, lon, fetched_at, payload = row
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        return CachedWeather(cell, lat, lon, fetched_at, payload, "db")
+
+    def lookup(self, cells: Iterable[str]) -> Dict[str, CachedWeather]:
+        """Fresh entries already cached for `cells` (no API calls)."""
+        found: Dict[str, CachedWeather] = {}
+        missing = []
+        for cell in cells:
+            entry = self._memory_get(cell)
+            if entry is not None:
+                found[cell] = entry
+            else:
+                missing.append(cell)
+        if not missing:
+            return found
+
+        with self.engine.connect() as con:
+            rows = con.execute(
+                text(
+                    """
+                    SELECT h3_res6, lat, lon, fetched_at, payload
+                    FROM public.weather_cache
+                    WHERE h3_res6 = ANY(:cells)
+                      AND units = :units
+                      AND fetched_at >= now() - make_interval(secs => :ttl)
+                """
+                ),
+                {
+                    "cells": missing,
+                    "units": self.units,
+                    "ttl": self.ttl.total_seconds(),
+                },
+            ).fetchall()
+        for row in rows:
+            entry = self._row_entry(row)
+            self._memory_put(entry)
+            found[entry.h3_res6] = entry
+        return found
+
+    def _db_get(self, cell: str) -> Optional[CachedWeather]:
+        with self.engine.connect() as con:
+            row = con.execute(
+                text(
+                    """
+                    SELECT h3_res6, lat, lon, fetched_at, payload
+                    FROM public.weather_cache
+                    WHERE h3_res6 = :cell
+                      AND units = :units
+                      AND fetched_at >= now() - make_interval(secs => :ttl)
+                """
+                ),
+                {"cell": cell, "units": self.units, "ttl": self.ttl.total_seconds()},
+            ).first()
+        return self._row_entry(row) if row is not None else None
+
+    def _claim(self, cell: str) -> bool:
+        """Take the cell's fetch lease unless another process holds a live one."""
+        with self.engine.begin() as con:
+            row = con.execute(
+                text(
+                    """
+                    INSERT INTO public.weather_cache_claims (h3_res6, units, claimed_until)
+                    VALUES (:cell, :units, clock_timestamp() + make_interval(secs => :lease))
+                    ON CONFLICT (h3_res6, units) DO UPDATE
+                    SET claimed_until = EXCLUDED.claimed_until
+                    WHERE weather_cache_claims.claimed_until < clock_timestamp()
+                    RETURNING 1
+                """
+                ),
+                {"cell": cell, "units": self.units, "lease": self.claim_sec},
+            ).first()
+        return row is not None
+
+    def _release(self, con, cell: str) -> None:
+        con.execute(
+            text(
+                "DELETE FROM public.weather_cache_claims WHERE h3_res6 = :cell AND units = :units"
+            ),
+            {"cell": cell, "units": self.units},
+        )
+
+    def _store(self, entry: CachedWeather) -> None:
+        """Upsert a fetched entry and drop the cell's lease in one short transaction."""
+        with self.engine.begin() as con:
+            con.execute(
+                text(
+                    """
+                    INSERT INTO public.weather_cache
+                        (h3_res6, units, lat, lon, fetched_at, payload)
+                    VALUES (:cell, :units, :lat, :lon, :fetched_at, CAST(:payload AS JSONB))
+                    ON CONFLICT (h3_res6, units) DO UPDATE
+                    SET lat = EXCLUDED.lat,
+                        lon = EXCLUDED.lon,
+                        fetched_at = EXCLUDED.fetched_at,
+                        payload = EXCLUDED.payload
+                """
+                ),
+                {
+                    "cell": entry.h3_res6,
+                    "units": self.units,
+                    "lat": entry.lat,
+                    "lon": entry.lon,
+                    "fetched_at": entry.fetched_at,
+                    "payload": json.dumps(entry.payload),
+                },
+            )
+            self._release(con, entry.h3_res6)
+
+    def _load_or_fetch(self, cell: str) -> Optional[CachedWeather]:
+        # Short transactions only: no connection is held across the limiter
+        # or the HTTP call. A leased claim row makes other processes wait for
+        # our row instead of calling the API too; an expired lease (crashed
+        # or slow holder) lets the next caller take over.
+        while True:
+            entry = self._db_get(cell)
+            if entry is not None:
+                self._memory_put(entry)
+                return entry
+            if self._claim(cell):
+                break
+            time.sleep(self.poll_sec)
+
+        stored = False
+        try:
+            if self.limiter is not None and not self.limiter.acquire(1):
+                return None
+            lat, lon = cell_to_latlng(cell)
+            try:
+                payload = self.client.current(lat, lon, units=self.units)
+            except Exception:
+                # the quota is charged up front; a failed call gives it back
+                if self.limiter is not None:
+                    self.limiter.refund(1)
+                raise
+            entry = CachedWeather(
+                cell, lat, lon, datetime.now(timezone.utc), payload, "api"
+            )
+            self._store(entry)
+            stored = True
+        finally:
+            if not stored:
+                with self.engine.begin() as con:
+                    self._release(con, cell)
+        self._memory_put(entry)
+        return entry
+
+    # ---- read-through ----
+
+    def get(self, cell: str) -> Optional[CachedWeather]:
+        """
+        Fresh weather for `cell`, fetching it at most once per TTL.
+        Returns None when the limiter has no budget left; API errors propagate.
+        """
+        entry = self._memory_get(cell)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            fut = self._inflight.get(cell)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[cell] = Future()
+        if not leader:
+            return fut.result()
+
+        try:
+            entry = self._load_or_fetch(cell)
+            fut.set_result(entry)
+            return entry
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(cell, None)
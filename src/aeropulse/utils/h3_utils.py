@@ -0,0 +1,82 @@
+from typing import Sequence, Tuple
+
+import h3
+import numpy as np
+
+
+# Compatibility wrappers for H3 v3/v4
+def latlng_to_cell(lat: float, lon: float, res: int = 6) -> str:
+    if hasattr(h3, "geo_to_h3"):
+        return h3.geo_to_h3(lat, lon, res)
+    if hasattr(h3, "latlng_to_cell"):
+        return h3.latlng_to_cell(lat, lon, res)
+    raise RuntimeError("No suitable H3 function found (geo_to_h3 or latlng_to_cell).")
+
+
+def cell_to_latlng(cell: str) -> Tuple[float, float]:
+    if hasattr(h3, "h3_to_geo"):
+        lat, lon = h3.h3_to_geo(cell)
+    elif hasattr(h3, "cell_to_latlng"):
+        lat, lon = h3.cell_to_latlng(cell)
+    else:
+        raise RuntimeError("No suitable H3 function found")
+    return float(lat), float(lon)
+
+
+def cell_to_parent(cell: str, res: int) -> str:
+    if hasattr(h3, "h3_to_parent"):
+        return h3.h3_to_parent(cell, res)
+    if hasattr(h3, "cell_to_parent"):
+        return h3.cell_to_parent(cell, res)
+    raise RuntimeError("No suitable H3 function found")
+
+
+def cell_to_center_child(cell: str, res: int) -> str:
+    if hasattr(h3, "h3_to_center_child"):
+        return h3.h3_to_center_child(cell, res)
+    if hasattr(h3, "cell_to_center_child"):
+        return h3.cell_to_center_child(cell, res)
+    raise RuntimeError("No suitable H3 function found")
+
+
+def representative_cell(cell: str, coverage_res: int) -> str:
+    """
+    The cell that stands in for `cell` when weather is shared at
+    `coverage_res`: the center child of its coverage_res parent, at the
+    resolution of `cell`. Identity when coverage_res is not coarser.
+    """
+    res = (
+        h3.h3_get_resolution(cell)
+        if hasattr(h3, "h3_get_resolution")
+        else h3.get_resolution(cell)
+    )
+    if coverage_res >= res:
+        return cell
+    return cell_to_center_child(cell_to_parent(cell, coverage_res), res)
+
+
+def latlng_to_cells(
+    lats: Sequence[float] | np.ndarray,
+    lons: Sequence[float] | np.ndarray,
+    res: int = 6,
+) -> np.ndarray:
+    """
+    Cells for whole coordinate columns in one call.
+
+    Validity (finite, in range) is checked with array masks up front, so the
+    per-point H3 call needs no try/except. Invalid points map to None.
+    Returns an object array aligned with the inputs.
+    """
+    lat = np.asarray(lats, dtype=float)
+    lon = np.asarray(lons, dtype=float)
+    out = np.full(lat.shape[0], None, dtype=object)
+    ok = (
+        np.isfinite(lat)
+        & np.isfinite(lon)
+        & (np.abs(lat) <= 90.0)
+        & (np.abs(lon) <= 180.0)
+    )
+    if ok.any():
+        index = latlng_to_cell
+        out[ok] = [index(a, b, res) for a, b in zip(lat[ok].tolist(), lon[ok].tolist())]
+    return out
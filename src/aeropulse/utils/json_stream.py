@@ -0,0 +1,124 @@
+import json
+import re
+from typing import Any, Iterable, Iterator
+
+_WS = " \t\r\n"
+# what may still follow a number's prefix ("1" -> "1.5", "1." -> "1.5e-3", ...)
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+
+class JsonStream:
+    """
+    Incremental JSON reader over an iterable of text chunks.
+
+    Values are decoded one at a time with JSONDecoder.raw_decode, so memory is
+    bounded by the largest single value being read rather than the whole
+    document. Containers can be walked element by element with `iter_array`
+    and `iter_object`; anything else is read whole with `value`.
+    """
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        for chunk in self._chunks:
+            if chunk:
+                self._buf = self._buf[self._pos :] + chunk
+                self._pos = 0
+                return True
+        self._eof = True
+        return False
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of input)."""
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _WS:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"Expected {ch!r} in JSON stream")
+        self._pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._eof or not self._fill():
+                    raise
+                continue
+            if not self._eof and self._may_continue(obj, end) and self._fill():
+                continue
+            self._pos = end
+            return obj
+
+    def _may_continue(self, obj: Any, end: int) -> bool:
+        """
+        True if the value decoded up to `end` could be a prefix of a longer
+        one: any scalar ending exactly at the buffer edge, or a number cut
+        mid-token (after '.', 'e'/'E' or a sign), which raw_decode accepts
+        as its shorter prefix.
+        """
+        if end == len(self._buf):
+            return True
+        if isinstance(obj, bool) or not isinstance(obj, (int, float)):
+            return False
+        return _NUMBER_TAIL.fullmatch(self._buf, end) is not None
+
+    def iter_array(self) -> Iterator[Any]:
+        """Yield the elements of the array at the cursor."""
+        self._expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            ch = self.peek()
+            self._pos += 1
+            if ch == "]":
+                return
+            if ch != ",":
+                raise ValueError("Malformed JSON array in stream")
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        Yield the keys of the object at the cursor. The caller must consume
+        each key's value (`value`, `iter_array`, ...) before asking for the next.
+        """
+        self._expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError("Expected a string key in JSON object")
+            self._expect(":")
+            yield key
+            ch = self.peek()
+            self._pos += 1
+            if ch == "}":
+                return
+            if ch != ",":
+                raise ValueError("Malformed JSON object in stream")
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array read from text chunks."""
+    stream = JsonStream(chunks)
+    if stream.peek() != "[":
+        raise ValueError("Expected a top-level JSON array")
+    yield from stream.iter_array()
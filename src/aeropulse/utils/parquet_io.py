@@ -1,7 +1,21 @@
 import os
+import uuid
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Sequence
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# high-repetition string keys worth dictionary-encoding
+DICTIONARY_COLUMNS = ("h3_res6", "icao24")
+
+
+def _compression() -> str:
+    return os.getenv("PARQUET_COMPRESSION", "zstd")
+
+
+def _row_group_size() -> int:
+    return int(os.getenv("PARQUET_ROW_GROUP_SIZE", "131072"))
 
 
 def ensure_dir(path: str | Path) -> Path:
@@ -17,32 +31,63 @@ def write_parquet(
     if filename is None:
         filename = "part.parquet"
     out = Path(base_dir) / filename
-    df.to_parquet(out, index=False)
+    df.to_parquet(out, index=False, compression=_compression())
     return str(out)
 
 
 def write_parquet_partitioned(
-    df: pd.DataFrame, base_dir: str | Path, partition_cols: list[str]
+    df: pd.DataFrame,
+    base_dir: str | Path,
+    partition_cols: list[str],
+    *,
+    append: bool = False,
+    compression: Optional[str] = None,
+    row_group_size: Optional[int] = None,
+    dictionary_cols: Sequence[str] = DICTIONARY_COLUMNS,
 ) -> str:
     """
     Save hive-style partitions: base_dir/col=value/...
+
+    Rows are split in a single pass by pyarrow.dataset.write_dataset (no
+    per-partition copies of the frame).
+      - append=False (default) replaces the files of every partition being
+        written.
+      - append=True writes uniquely named part files next to existing ones,
+        so repeated runs for the same hour accumulate; callers that re-read
+        an overlapping window must pass only rows not written before.
+    compression / row_group_size default to PARQUET_COMPRESSION (zstd) and
+    PARQUET_ROW_GROUP_SIZE; `dictionary_cols` present in the frame are
+    dictionary-encoded.
     """
     base = ensure_dir(base_dir)
     if not partition_cols:
-        return write_parquet(df, base)
-    # naive partitioning
-    keys = df[partition_cols].drop_duplicates()
-    paths = []
-    for _, row in keys.iterrows():
-        subset = df.copy()
-        mask = True
-        part_path = base
-        for c in partition_cols:
-            v = row[c]
-            mask = mask & (subset[c] == v)
-            part_path = part_path / f"{c}={v}"
-        ensure_dir(part_path)
-        out = part_path / "part.parquet"
-        subset[mask].to_parquet(out, index=False)
-        paths.append(str(out))
+        filename = f"part-{uuid.uuid4().hex}.parquet" if append else None
+        return write_parquet(df, base, filename)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    dict_cols = [
+        c
+        for c in dictionary_cols
+        if c in table.column_names and c not in partition_cols
+    ]
+    fmt = ds.ParquetFileFormat()
+    options = fmt.make_write_options(
+        compression=compression or _compression(),
+        use_dictionary=dict_cols or False,
+    )
+    rows_per_group = row_group_size or _row_group_size()
+
+    ds.write_dataset(
+        table,
+        base,
+        format=fmt,
+        file_options=options,
+        partitioning=partition_cols,
+        partitioning_flavor="hive",
+        basename_template=(
+            f"part-{uuid.uuid4().hex}-{{i}}.parquet" if append else "part-{i}.parquet"
+        ),
+        existing_data_behavior=("overwrite_or_ignore" if append else "delete_matching"),
+        max_rows_per_group=rows_per_group,
+    )
     return str(base)
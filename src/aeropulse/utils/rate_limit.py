@@ -1,13 +1,21 @@
 import os
+import threading
 import time
 from datetime import datetime, timezone, date
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
 
 
 class DailyBudget:
     """
     Super-simple in-process daily budget.
     Not distributed; for single-run jobs it’s perfect.
-    If you need distributed, back it with Postgres (table) or Redis.
+    For a quota shared across runs and hosts use PgTokenBucket.
+
+    Thread-safe: worker threads can share one instance, and
+    `wait_min_interval` spaces calls globally rather than per thread.
     """
 
     def __init__(self, daily_limit: int, min_interval_sec: float = 0.0):
@@ -16,27 +24,210 @@ class DailyBudget:
         self.day = date.today()
         self.used = 0
         self.last_ts = 0.0
+        self._lock = threading.Lock()
 
-    def remaining(self) -> int:
+    def _roll_day(self):
         if date.today() != self.day:
             self.day = date.today()
             self.used = 0
-        return max(0, self.daily_limit - self.used)
+
+    def remaining(self) -> int:
+        with self._lock:
+            self._roll_day()
+            return max(0, self.daily_limit - self.used)
 
     def consume(self, n: int = 1):
-        if date.today() != self.day:
-            self.day = date.today()
-            self.used = 0
-        self.used += n
+        with self._lock:
+            self._roll_day()
+            self.used += n
+
+    def try_consume(self, n: int = 1) -> bool:
+        """Atomically take `n` units if available; False when the budget is spent."""
+        with self._lock:
+            self._roll_day()
+            if self.used + n > self.daily_limit:
+                return False
+            self.used += n
+            return True
+
+    def refund(self, n: int = 1):
+        """Give back `n` units charged for a call that failed."""
+        with self._lock:
+            self._roll_day()
+            self.used = max(0, self.used - n)
 
     def wait_min_interval(self):
         if self.min_interval <= 0:
             return
-        now = time.time()
-        delta = now - self.last_ts
-        if delta < self.min_interval:
-            time.sleep(self.min_interval - delta)
-        self.last_ts = time.time()
+        # reserve the next free slot under the lock, then sleep outside it
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self.last_ts + self.min_interval)
+            self.last_ts = slot
+        if slot > now:
+            time.sleep(slot - now)
+
+    def acquire(self, n: int = 1) -> bool:
+        """Take `n` units and wait out the min interval; False when spent."""
+        if not self.try_consume(n):
+            return False
+        self.wait_min_interval()
+        return True
+
+
+class PgTokenBucket:
+    """
+    Token bucket with a per-minute rate and a per-UTC-day quota, kept in one
+    row of public.api_rate_limits so every thread, process and host calling
+    the same API shares it. Each acquire is a short transaction holding the
+    row lock (SELECT ... FOR UPDATE) and uses the database clock, read after
+    the lock is granted so a waiter never refills an interval twice.
+
+    Exposes the same `acquire` / `refund` / `remaining` interface as
+    DailyBudget.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        name: str,
+        per_minute: int,
+        per_day: int,
+        burst: Optional[int] = None,
+    ):
+        self.engine = engine
+        self.name = name
+        self.per_day = per_day
+        self.capacity = float(burst or per_minute)
+        self.rate = per_minute / 60.0  # tokens per second
+
+    def _lock_row(self, con):
+        return con.execute(
+            text(
+                """
+                SELECT tokens, refilled_at, day, day_used
+                FROM public.api_rate_limits
+                WHERE name = :name
+                FOR UPDATE
+            """
+            ),
+            {"name": self.name},
+        ).first()
+
+    def _take(self, n: int) -> Tuple[bool, Optional[float]]:
+        """
+        One locked attempt. Returns (granted, wait_sec); wait_sec is None
+        when the daily quota is spent and waiting will not help today.
+        """
+        with self.engine.begin() as con:
+            row = self._lock_row(con)
+            if row is None:
+                # first use of this bucket: seed it full, then lock it
+                con.execute(
+                    text(
+                        """
+                        INSERT INTO public.api_rate_limits (name, tokens, refilled_at, day, day_used)
+                        VALUES (:name, :cap, clock_timestamp(), (clock_timestamp() AT TIME ZONE 'UTC')::date, 0)
+                        ON CONFLICT (name) DO NOTHING
+                    """
+                    ),
+                    {"name": self.name, "cap": self.capacity},
+                )
+                row = self._lock_row(con)
+            tokens, refilled_at, day, day_used = row
+            # read the clock only once the lock is held: now() is the
+            # transaction start, before any wait on FOR UPDATE
+            db_now, today = con.execute(
+                text(
+                    "SELECT clock_timestamp(), (clock_timestamp() AT TIME ZONE 'UTC')::date"
+                )
+            ).one()
+
+            elapsed = max(0.0, (db_now - refilled_at).total_seconds())
+            tokens = min(self.capacity, tokens + elapsed * self.rate)
+            if day != today:
+                day, day_used = today, 0
+
+            granted = False
+            wait: Optional[float] = 0.0
+            if day_used + n > self.per_day:
+                wait = None
+            elif tokens < n:
+                wait = (n - tokens) / self.rate if self.rate > 0 else None
+            else:
+                tokens -= n
+                day_used += n
+                granted = True
+
+            con.execute(
+                text(
+                    """
+                    UPDATE public.api_rate_limits
+                    SET tokens = :tokens,
+                        refilled_at = GREATEST(refilled_at, :now),
+                        day = :day,
+                        day_used = :used
+                    WHERE name = :name
+                """
+                ),
+                {
+                    "tokens": tokens,
+                    "now": db_now,
+                    "day": day,
+                    "used": day_used,
+                    "name": self.name,
+                },
+            )
+        return granted, wait
+
+    def acquire(self, n: int = 1, timeout: Optional[float] = None) -> bool:
+        """
+        Block until `n` tokens are granted. False when the daily quota is
+        spent, or when `timeout` seconds pass first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            granted, wait = self._take(n)
+            if granted:
+                return True
+            if wait is None:
+                return False
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def refund(self, n: int = 1):
+        """
+        Give back `n` units of today's quota charged for a call that failed.
+        The per-minute tokens stay spent so failing calls are still paced.
+        """
+        with self.engine.begin() as con:
+            con.execute(
+                text(
+                    """
+                    UPDATE public.api_rate_limits
+                    SET day_used = GREATEST(day_used - :n, 0)
+                    WHERE name = :name AND day = (clock_timestamp() AT TIME ZONE 'UTC')::date
+                """
+                ),
+                {"n": n, "name": self.name},
+            )
+
+    def remaining(self) -> int:
+        """Units left in today's quota (the per-minute rate is not counted)."""
+        with self.engine.connect() as con:
+            row = con.execute(
+                text(
+                    """
+                    SELECT day_used
+                    FROM public.api_rate_limits
+                    WHERE name = :name AND day = (now() AT TIME ZONE 'UTC')::date
+                """
+                ),
+                {"name": self.name},
+            ).first()
+        used = row[0] if row else 0
+        return max(0, self.per_day - used)
 
 
 def env_daily_budget(default: int = 900) -> int:
@@ -46,3 +237,19 @@ def env_daily_budget(default: int = 900) -> int:
     except Exception:
         val = default
     return max(0, val)
+
+
+def openweather_limiter(engine: Engine):
+    """
+    Limiter shared by every OpenWeather caller.
+
+    OPENWEATHER_RATE_LIMITER=postgres (default) enforces
+    OPENWEATHER_PER_MINUTE and OPENWEATHER_DAILY_BUDGET across runs and
+    hosts; =local falls back to an in-process DailyBudget.
+    """
+    daily = env_daily_budget(900)
+    if os.getenv("OPENWEATHER_RATE_LIMITER", "postgres").lower() == "local":
+        min_interval = float(os.getenv("OPENWEATHER_MIN_INTERVAL_SEC", "0.1"))
+        return DailyBudget(daily_limit=daily, min_interval_sec=min_interval)
+    per_minute = int(os.getenv("OPENWEATHER_PER_MINUTE", "60"))
+    return PgTokenBucket(engine, "openweather", per_minute=per_minute, per_day=daily)